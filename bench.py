@@ -0,0 +1,114 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from glob import glob
+
+from main import compile_source, get_code
+from metering import MeteredVM
+from optimizer import optimize
+from vm import VM
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RUN_PATH_MODULES = ["vm", "bytecode"]
+COMPILE_PATH_MODULES = ["tokenizer", "parser", "generator"]
+
+
+def parameters(source) -> list[str]:
+    """Parameter names of the Algorithm declared in source"""
+    match = re.search(r"Algorithm\s+\w+\s*\(([^)]*)\)", source)
+    return [name.strip() for name in match.group(1).split(",") if name.strip()]
+
+
+def make_inputs(names, size):
+    """Inputs for a demo: a reversed array A, its length n, and 0 for anything else"""
+    inputs = {}
+    for name in names:
+        if name == "A":
+            inputs[name] = list(range(size, 0, -1))
+        elif name == "n":
+            inputs[name] = size
+        else:
+            inputs[name] = 0
+    return inputs
+
+
+def time_run(instructions, names, size, repeat, **options):
+    """Best wall time of running a program over fresh inputs"""
+    vm = VM(instructions, **options)
+    best = float("inf")
+    for _ in range(repeat):
+        inputs = make_inputs(names, size)
+        start = time.perf_counter()
+        vm.run(**inputs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def instruction_count(instructions, names, size) -> int:
+    """Instructions executed by one run over fresh inputs"""
+    vm = MeteredVM(instructions)
+    vm.run(**make_inputs(names, size))
+    return vm.meter().instructions
+
+
+def import_times(modules) -> dict[str, int]:
+    """Cumulative import time in microseconds of each module, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # Top-level imports have a single space before the name, nested ones more.
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+        if match and match.group(2) in modules:
+            times[match.group(2)] = int(match.group(1))
+    return times
+
+
+def main(repeat=5, size=200):
+    print(f"{'program':<24}{'execute':>12}{'verified':>12}{'jit':>12}")
+    for path in sorted(glob(os.path.join(ROOT, "demos", "*.psu"))):
+        source = get_code(path)
+        instructions = compile_source(source)
+        names = parameters(source)
+        plain = time_run(instructions, names, size, repeat)
+        verified = time_run(instructions, names, size, repeat, verify=True)
+        jit = time_run(instructions, names, size, repeat, verify=True, jit=True)
+        print(
+            f"{os.path.basename(path):<24}{plain * 1000:>10.2f}ms"
+            f"{verified * 1000:>10.2f}ms{jit * 1000:>10.2f}ms"
+        )
+
+    print()
+    print(f"dynamic instructions (size {size}); layout only changes code with chained jumps")
+    print(f"{'program':<24}{'generator':>12}{'layout':>12}{'saved':>8}")
+    for path in sorted(glob(os.path.join(ROOT, "demos", "*.psu"))):
+        source = get_code(path)
+        instructions = compile_source(source)
+        names = parameters(source)
+        before = instruction_count(instructions, names, size)
+        after = instruction_count(optimize(instructions), names, size)
+        print(
+            f"{os.path.basename(path):<24}{before:>12}{after:>12}"
+            f"{(before - after) / before:>8.1%}"
+        )
+
+    print()
+    print("import time (cumulative, -X importtime)")
+    for label, modules in (
+        ("run path", RUN_PATH_MODULES),
+        ("compile path", RUN_PATH_MODULES + COMPILE_PATH_MODULES),
+    ):
+        times = import_times(modules)
+        detail = ", ".join(f"{name} {us}us" for name, us in times.items())
+        print(f"  {label:<14}{sum(times.values()):>8}us  ({detail})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import struct
+
+from opcodes import OpCode, Instruction
+
+MAGIC = b"PSUB"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+COUNT = struct.Struct("<I")
+RECORD = struct.Struct("<BBB")
+OPERAND = struct.Struct("<q")
+MAX_OPERANDS = 8
+
+
+def dumps(instructions: list[Instruction]) -> bytes:
+    """Encode instructions in a flat binary layout.
+
+    The layout is a header, a table of the distinct string operands, and one
+    record per instruction: opcode, operand count, a bitmask of which operands
+    are strings, then each operand as an int64 (the integer itself or an index
+    into the string table).
+    """
+    strings = {}
+    records = []
+    for instr in instructions:
+        if len(instr.operands) > MAX_OPERANDS:
+            raise ValueError(f"Too many operands to encode: {instr}")
+        mask = 0
+        values = []
+        for i, operand in enumerate(instr.operands):
+            if isinstance(operand, int):
+                values.append(operand)
+            else:
+                mask |= 1 << i
+                values.append(strings.setdefault(str(operand), len(strings)))
+        records.append(RECORD.pack(instr.opcode.value, len(values), mask))
+        records.extend(OPERAND.pack(value) for value in values)
+
+    parts = [HEADER.pack(MAGIC, VERSION, len(strings))]
+    for string in strings:
+        encoded = string.encode()
+        parts.append(COUNT.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(COUNT.pack(len(instructions)))
+    parts.extend(records)
+    return b"".join(parts)
+
+
+def loads(data) -> list[Instruction]:
+    """Decode instructions produced by dumps; data may be any buffer"""
+    data = memoryview(data)
+    magic, version, string_count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a compiled pseudo code program")
+    if version != VERSION:
+        raise ValueError(f"Unsupported bytecode version {version}")
+
+    offset = HEADER.size
+    strings = []
+    for _ in range(string_count):
+        (length,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        strings.append(str(data[offset : offset + length], "utf-8"))
+        offset += length
+
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+
+    opcodes = {opcode.value: opcode for opcode in OpCode}
+    instructions = []
+    for _ in range(count):
+        opcode, operand_count, mask = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        operands = []
+        for i in range(operand_count):
+            (value,) = OPERAND.unpack_from(data, offset)
+            offset += OPERAND.size
+            operands.append(strings[value] if mask & (1 << i) else value)
+        instructions.append(Instruction(opcodes[opcode], *operands))
+    return instructions
+
+
+def dump(instructions: list[Instruction], path: str):
+    """Write compiled instructions to path"""
+    with open(path, "wb") as f:
+        f.write(dumps(instructions))
+
+
+def load(path: str) -> list[Instruction]:
+    """Read compiled instructions from path"""
+    with open(path, "rb") as f:
+        return loads(f.read())
@@ -0,0 +1,446 @@
+from fractions import Fraction
+from math import comb
+
+from generator import Generator
+from parser import (
+    Literal,
+    Identifier,
+    BinaryOp,
+    Call,
+    Assignment,
+    IfStatement,
+    WhileLoop,
+    ForLoop,
+    ReturnStatement,
+    Block,
+    FunctionStatement,
+    unparse,
+)
+
+COMPILE_THRESHOLD = 50_000
+LARGE = 10**6
+
+
+class Polynomial:
+    """A polynomial in named symbols with exact rational coefficients.
+
+    ``terms`` maps monomials, sorted tuples of (symbol, power) pairs, to
+    nonzero Fractions; the constant term's monomial is ().
+    """
+
+    def __init__(self, terms=None):
+        self.terms = {m: Fraction(c) for m, c in (terms or {}).items() if c}
+
+    @classmethod
+    def constant(cls, value):
+        return cls({(): value})
+
+    @classmethod
+    def symbol(cls, name):
+        return cls({((name, 1),): 1})
+
+    @staticmethod
+    def lift(value):
+        return value if isinstance(value, Polynomial) else Polynomial.constant(value)
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for m, c in Polynomial.lift(other).terms.items():
+            terms[m] = terms.get(m, 0) + c
+        return Polynomial(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Polynomial({m: -c for m, c in self.terms.items()})
+
+    def __sub__(self, other):
+        return self + -Polynomial.lift(other)
+
+    def __rsub__(self, other):
+        return Polynomial.lift(other) - self
+
+    def __mul__(self, other):
+        terms = {}
+        for m1, c1 in self.terms.items():
+            for m2, c2 in Polynomial.lift(other).terms.items():
+                powers = dict(m1)
+                for name, power in m2:
+                    powers[name] = powers.get(name, 0) + power
+                m = tuple(sorted(powers.items()))
+                terms[m] = terms.get(m, 0) + c1 * c2
+        return Polynomial(terms)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, number):
+        return Polynomial({m: c / number for m, c in self.terms.items()})
+
+    def __pow__(self, power: int):
+        result = Polynomial.constant(1)
+        for _ in range(power):
+            result = result * self
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, Polynomial) and self.terms == other.terms
+
+    def symbols(self) -> set[str]:
+        return {name for m in self.terms for name, _ in m}
+
+    def degree(self) -> int:
+        return max((sum(p for _, p in m) for m in self.terms), default=0)
+
+    def leading(self):
+        """The terms of highest total degree"""
+        degree = self.degree()
+        return Polynomial({m: c for m, c in self.terms.items() if sum(p for _, p in m) == degree})
+
+    def coefficients(self, name) -> dict[int, "Polynomial"]:
+        """The polynomial as sum(coefficient * name**power), keyed by power"""
+        result = {}
+        for m, c in self.terms.items():
+            power = dict(m).get(name, 0)
+            rest = tuple((n, p) for n, p in m if n != name)
+            result[power] = result.get(power, Polynomial()) + Polynomial({rest: c})
+        return result
+
+    def substitute(self, name, value):
+        """Replace a symbol by a polynomial"""
+        result = Polynomial()
+        for power, coefficient in self.coefficients(name).items():
+            result = result + coefficient * Polynomial.lift(value) ** power
+        return result
+
+    def evaluate(self, values) -> Fraction:
+        total = Fraction(0)
+        for m, c in self.terms.items():
+            term = c
+            for name, power in m:
+                term *= values[name] ** power
+            total += term
+        return total
+
+    def __repr__(self):
+        return f"Polynomial({self})"
+
+    def __str__(self):
+        if not self.terms:
+            return "0"
+        ordered = sorted(self.terms.items(), key=lambda t: (-sum(p for _, p in t[0]), t[0]))
+        text = ""
+        for m, c in ordered:
+            factors = [name if power == 1 else f"{name}^{power}" for name, power in m]
+            if abs(c) != 1 or not factors:
+                factors.insert(0, str(abs(c)))
+            term = "*".join(factors)
+            if not text:
+                text = f"-{term}" if c < 0 else term
+            else:
+                text += f" - {term}" if c < 0 else f" + {term}"
+        return text
+
+
+def _bernoulli(count) -> list[Fraction]:
+    """B_0..B_{count-1} with the B_1 = +1/2 convention"""
+    numbers = []
+    for m in range(count):
+        b = Fraction(1) - sum(Fraction(comb(m, k), m - k + 1) * numbers[k] for k in range(m))
+        numbers.append(b)
+    return numbers
+
+
+def power_sum(power, upper) -> Polynomial:
+    """sum(i**power for i in 1..upper) by Faulhaber's formula"""
+    upper = Polynomial.lift(upper)
+    bernoulli = _bernoulli(power + 1)
+    result = Polynomial()
+    for j in range(power + 1):
+        coefficient = Fraction(comb(power + 1, j)) * bernoulli[j] / (power + 1)
+        result = result + coefficient * upper ** (power + 1 - j)
+    return result
+
+
+def summation(body, name, low, high) -> Polynomial:
+    """sum(body for name in low..high), assuming the range is not empty"""
+    result = Polynomial()
+    for power, coefficient in body.coefficients(name).items():
+        result = result + coefficient * (power_sum(power, high) - power_sum(power, low - 1))
+    return result
+
+
+def size(node) -> int:
+    """Instructions the generator emits for a statement or expression"""
+    return len(Generator().generate(Block([node])))
+
+
+def _assigned(node) -> set[str]:
+    """Scalar names assigned anywhere inside a node"""
+    if isinstance(node, Assignment):
+        return {node.target.name} if isinstance(node.target, Identifier) else set()
+    if isinstance(node, Block):
+        return set().union(*map(_assigned, node.statements))
+    if isinstance(node, IfStatement):
+        return _assigned(node.then_block) | (_assigned(node.else_block) if node.else_block else set())
+    if isinstance(node, WhileLoop):
+        return _assigned(node.body)
+    if isinstance(node, ForLoop):
+        return _assigned(node.assignment) | _assigned(node.body)
+    if isinstance(node, FunctionStatement):
+        return _assigned(node.body)
+    return set()
+
+
+def _worst(a, b) -> Polynomial:
+    """The costlier of two branches once every symbol is large"""
+    values = dict.fromkeys(a.symbols() | b.symbols(), LARGE)
+    return a if a.evaluate(values) >= b.evaluate(values) else b
+
+
+class Estimate:
+    """Predicted cost of a program.
+
+    ``instructions`` is the number of executed instructions as a polynomial
+    in the parameters, ``length(A)`` for the length of array parameter A and
+    one symbol per loop whose trip count is unknown. It takes the costlier
+    side of every if and runs every loop to completion, so it is exact on
+    worst-case inputs of programs without early returns and an upper bound
+    otherwise. ``unbounded`` describes the loops behind the unknown symbols
+    and ``parallel`` tells whether some for loop can run on the process pool.
+    """
+
+    def __init__(self, instructions, unbounded, parallel):
+        self.instructions = instructions
+        self.unbounded = unbounded
+        self.parallel = parallel
+
+    @property
+    def bounded(self) -> bool:
+        return not self.unbounded
+
+    def predict(self, inputs) -> int | None:
+        """Instructions for concrete inputs, or None if a loop is unbounded"""
+        if not self.bounded:
+            return None
+        values = {}
+        for name in self.instructions.symbols():
+            if name.startswith("length("):
+                values[name] = len(inputs.get(name[len("length(") : -1], ()))
+            else:
+                values[name] = inputs.get(name, 0)
+        return max(0, round(self.instructions.evaluate(values)))
+
+    def __str__(self):
+        lines = [f"instructions ~ {self.instructions.leading()}  ({self.instructions})"]
+        lines += [f"unbounded: {note}" for note in self.unbounded]
+        return "\n".join(lines)
+
+
+class CostModel:
+    """Walks the AST pricing each node by the code the generator emits for it.
+
+    Scalars whose value is a polynomial in the parameters are tracked in
+    ``env`` as execution proceeds, so loop bounds like ``n - 1`` or a
+    variable holding ``length(A)`` give symbolic trip counts, and loops whose
+    body cost depends on an outer loop variable are summed exactly.
+    """
+
+    def __init__(self):
+        self.env = {}
+        self.arrays = set()
+        self.unbounded = []
+
+    def value(self, node) -> Polynomial | None:
+        """Symbolic value of an expression, or None if it is not a polynomial"""
+        if isinstance(node, Literal):
+            try:
+                return Polynomial.constant(int(node.value))
+            except ValueError:
+                return self.env.get(str(node.value))
+        if isinstance(node, Identifier):
+            return self.env.get(node.name)
+        if isinstance(node, Call) and node.name == "length" and len(node.args) == 1:
+            array = node.args[0]
+            if isinstance(array, Identifier) and array.name in self.arrays:
+                return Polynomial.symbol(f"length({array.name})")
+            return None
+        if isinstance(node, BinaryOp) and node.operator in ("+", "-", "*", "/"):
+            left, right = self.value(node.left), self.value(node.right)
+            if left is None or right is None:
+                return None
+            if node.operator == "+":
+                return left + right
+            if node.operator == "-":
+                return left - right
+            if node.operator == "*":
+                return left * right
+            if not right.symbols() and right.terms:
+                return left / right.terms[()]
+        return None
+
+    def _forget(self, names):
+        for name in names:
+            self.env.pop(name, None)
+
+    def _unknown(self, description) -> Polynomial:
+        name = f"w{len(self.unbounded) + 1}"
+        self.unbounded.append(f"{name}: {description}")
+        return Polynomial.symbol(name)
+
+    def block(self, node) -> Polynomial:
+        total = Polynomial()
+        for stmt in node.statements:
+            total = total + self.statement(stmt)
+        return total
+
+    def statement(self, node) -> Polynomial:
+        if isinstance(node, FunctionStatement):
+            params = [param.name for param in node.param_ids]
+            self.arrays = {name for name in params if name not in _assigned(node.body)}
+            self.env = {name: Polynomial.symbol(name) for name in params}
+            statements = node.body.statements
+            returns = bool(statements) and isinstance(statements[-1], ReturnStatement)
+            return self.block(node.body) + (0 if returns else 1)
+        if isinstance(node, IfStatement):
+            return self.if_statement(node)
+        if isinstance(node, ForLoop):
+            return self.for_loop(node)
+        if isinstance(node, WhileLoop):
+            return self.while_loop(node)
+        if isinstance(node, Assignment) and isinstance(node.target, Identifier):
+            value = self.value(node.value)
+            if value is None:
+                self.env.pop(node.target.name, None)
+            else:
+                self.env[node.target.name] = value
+        if isinstance(node, Block):
+            return self.block(node)
+        return Polynomial.constant(size(node))
+
+    def if_statement(self, node) -> Polynomial:
+        condition = size(node.condition) + 1
+        env = self.env
+        self.env = dict(env)
+        then = self.block(node.then_block)
+        otherwise = Polynomial()
+        if node.else_block:
+            then = then + 1
+            self.env = dict(env)
+            otherwise = self.block(node.else_block)
+        self.env = env
+        self._forget(_assigned(node))
+        return condition + _worst(then, otherwise)
+
+    def _iterations(self, var, low, high, body, description) -> Polynomial:
+        """Total cost of per-iteration cost body over var in low..high"""
+        if low is not None and high is not None:
+            return summation(body, var, low, high)
+        trips = self._unknown(description)
+        return trips * body.substitute(var, trips)
+
+    def for_loop(self, node) -> Polynomial:
+        var = node.assignment.target.name
+        low = self.value(node.assignment.value)
+        self._forget(_assigned(node))
+        high = self.value(node.end)
+        header = size(node.end) + 2
+
+        self.env[var] = Polynomial.symbol(var)
+        body = self.block(node.body) + header + 3
+        self._forget(_assigned(node))
+        total = self._iterations(var, low, high, body, f"for {unparse(node.assignment)} to {unparse(node.end)}")
+        if high is not None:
+            self.env[var] = high + 1
+        return size(node.assignment) + total + header
+
+    def _counter(self, node, body_assigned):
+        """(var, low, high) of a while loop counting var up by one to an invariant bound"""
+        cond = node.condition
+        if not (isinstance(cond, BinaryOp) and cond.operator in ("<", "<=")):
+            return None
+        if not isinstance(cond.left, Identifier):
+            return None
+        var = cond.left.name
+        step = Assignment(Identifier(var), BinaryOp(Identifier(var), "+", Literal("1")))
+        steps = [
+            stmt
+            for stmt in node.body.statements
+            if isinstance(stmt, Assignment) and repr(stmt) == repr(step)
+        ]
+        others = _assigned(Block([s for s in node.body.statements if s not in steps]))
+        if len(steps) != 1 or var in others:
+            return None
+        low = self.env.get(var)
+        saved = {name: self.env.pop(name) for name in body_assigned if name in self.env}
+        high = self.value(cond.right)
+        self.env.update(saved)
+        if low is None or high is None:
+            return None
+        return var, low, high - 1 if cond.operator == "<" else high
+
+    def while_loop(self, node) -> Polynomial:
+        assigned = _assigned(node.body)
+        counter = self._counter(node, assigned)
+        header = size(node.condition) + 1
+        self._forget(assigned)
+
+        description = f"while {unparse(node.condition)}"
+        if counter is None:
+            var, low, high = None, None, None
+        else:
+            var, low, high = counter
+            self.env[var] = Polynomial.symbol(var)
+        body = self.block(node.body) + header + 1
+        self._forget(assigned)
+        if counter is None:
+            total = self._unknown(description) * body
+        else:
+            total = self._iterations(var, low, high, body, description)
+            self.env[var] = high + 1
+        return total + header
+
+
+def estimate(ast) -> Estimate:
+    """Estimate the executed instructions of a parsed program"""
+    from parallel import NotParallel, analyze
+
+    model = CostModel()
+    instructions = model.block(ast)
+
+    parallel = False
+    stack = list(ast.statements)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ForLoop):
+            try:
+                analyze(node)
+                parallel = True
+            except NotParallel:
+                pass
+        if isinstance(node, (ForLoop, WhileLoop, FunctionStatement)):
+            stack.extend(node.body.statements)
+        elif isinstance(node, IfStatement):
+            stack.extend(node.then_block.statements)
+            if node.else_block:
+                stack.extend(node.else_block.statements)
+    return Estimate(instructions, model.unbounded, parallel)
+
+
+def recommend_engine(estimate, inputs) -> str:
+    """Pick "interpreter", "jit" or "parallel" for a run on inputs.
+
+    Short runs stay on the verified interpreter, where tracing would not pay
+    for itself; longer ones use the JIT, or the process pool if a loop can
+    be split and the run is past the pool's threshold. Programs with an
+    unbounded loop cannot be predicted and get the JIT.
+    """
+    from parallel import PARALLEL_THRESHOLD
+
+    predicted = estimate.predict(inputs)
+    if predicted is None:
+        return "jit"
+    if estimate.parallel and predicted >= PARALLEL_THRESHOLD:
+        return "parallel"
+    if predicted >= COMPILE_THRESHOLD:
+        return "jit"
+    return "interpreter"
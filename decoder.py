@@ -0,0 +1,114 @@
+from opcodes import OpCode, parse_operand, split_target
+
+ARITHMETIC = {"+": "+", "-": "-", "*": "*", "/": "//"}
+COMPARISONS = {"<": "<", ">": ">", "<=": "<=", ">=": ">=", "=": "==", "!=": "!="}
+
+
+def _body(pc, instr, size, verification) -> list[str]:
+    """Python statements executing one instruction and returning the next pc"""
+    opcode = instr.opcode
+    operands = instr.operands
+    defined = verification.defined.get(pc, ()) if verification else ()
+    proven = verification is not None and pc in verification.in_bounds
+    nxt = pc + 1
+
+    def value(operand) -> str:
+        operand = parse_operand(operand)
+        if isinstance(operand, int):
+            return repr(operand)
+        if operand in defined:
+            return f"v[{operand!r}]"
+        return f"v.get({operand!r}, 0)"
+
+    if opcode == OpCode.ASN:
+        name, index = split_target(operands[0])
+        if index is None:
+            return [f"v[{name!r}] = {value(operands[1])}", f"return {nxt}"]
+        if proven:
+            return [f"v[{name!r}][{value(index)}] = {value(operands[1])}", f"return {nxt}"]
+        return [
+            f"x = {value(operands[1])}",
+            f"i = {value(index)}",
+            f"if {name!r} not in v:",
+            f"    v[{name!r}] = []",
+            f"a = v[{name!r}]",
+            "while len(a) <= i:",
+            "    a.append(0)",
+            "a[i] = x",
+            f"return {nxt}",
+        ]
+
+    elif opcode == OpCode.AOP:
+        op, left, right, result = operands
+        if op == "=":
+            return [f"v[{str(result)!r}] = {value(right)}", f"return {nxt}"]
+        if op not in ARITHMETIC:
+            return [f"return {nxt}"]
+        expr = f"{value(left)} {ARITHMETIC[op]} {value(right)}"
+        return [f"v[{str(result)!r}] = {expr}", f"return {nxt}"]
+
+    elif opcode == OpCode.COM:
+        op, left, right, result = operands
+        if op in COMPARISONS:
+            expr = f"{value(left)} {COMPARISONS[op]} {value(right)}"
+        else:
+            expr = "False"
+        return [f"vm.last_cmp = v[{str(result)!r}] = {expr}", f"return {nxt}"]
+
+    elif opcode == OpCode.IDX:
+        array, index, result = str(operands[0]), operands[1], str(operands[2])
+        if proven:
+            return [f"v[{result!r}] = v[{array!r}][{value(index)}]", f"return {nxt}"]
+        return [
+            f"a = v.get({array!r}, [])",
+            f"i = {value(index)}",
+            f"v[{result!r}] = a[i] if i < len(a) else 0",
+            f"return {nxt}",
+        ]
+
+    elif opcode == OpCode.CAL:
+        name, *args, result = operands
+        call = f"intrinsic_{name}({', '.join(value(arg) for arg in args)})"
+        return [f"v[{str(result)!r}] = {call}", f"return {nxt}"]
+
+    elif opcode == OpCode.SKP:
+        return [f"return {nxt} if vm.last_cmp else {nxt + int(operands[0])}"]
+
+    elif opcode == OpCode.JMP:
+        return [f"return {int(operands[0])}"]
+
+    elif opcode == OpCode.RET:
+        result = value(operands[0]) if operands else "None"
+        return [f"vm.return_value = {result}", f"return {nxt + size}"]
+
+    return [f"return {nxt}"]
+
+
+def decode(instructions, verification=None, metered=False):
+    """Translate instructions into a code object defining one function per instruction.
+
+    Each function executes its instruction against the register dict ``v``
+    and returns the next pc, so operand parsing and operator dispatch happen
+    once here instead of on every step. Without a verification every access
+    keeps the interpreter's guards (default 0, bounds checks, array
+    creation); with one, reads proven defined and accesses proven in bounds
+    become plain dict and list indexing. Metered code also counts every
+    execution of pc in ``counts[pc]``.
+    """
+    size = len(instructions)
+    lines = []
+    for pc, instr in enumerate(instructions):
+        lines.append(f"def op_{pc}():")
+        if metered:
+            lines.append(f"    counts[{pc}] += 1")
+        lines.extend(f"    {line}" for line in _body(pc, instr, size, verification))
+    return compile("\n".join(lines), "<decoded>", "exec")
+
+
+def bind(code, vm, **names) -> list:
+    """Instantiate decoded instructions against a VM's registers, indexed by pc"""
+    from intrinsics import namespace as intrinsics
+
+    namespace = {"v": vm.variables, "vm": vm, **intrinsics(), **names}
+    exec(code, namespace)
+    return [namespace[f"op_{pc}"] for pc in range(len(vm.instructions))]
@@ -0,0 +1,616 @@
+import array
+import os
+import random
+import tempfile
+import zlib
+
+from bytecode import dumps, loads
+from generator import Generator
+from parser import (
+    Literal,
+    Identifier,
+    ArrayAccess,
+    BinaryOp,
+    Call,
+    Assignment,
+    IfStatement,
+    WhileLoop,
+    ForLoop,
+    ReturnStatement,
+    Block,
+    FunctionStatement,
+    unparse,
+)
+from vm import VM, Status
+
+PARAMS = ("A", "B", "n", "x")
+SCALARS = ("x", "y", "z")
+ARRAYS = ("A", "B")
+LOOP_VARS = ("i", "j", "k")
+MAX_STEPS = 100_000
+JIT_RUNS = 40
+SLICE = 3
+RESUME_AFTER = 20
+MAX_SHRINK_STEPS = 2000
+
+
+class ProgramGenerator:
+    """Random programs built from the parser's AST classes.
+
+    Every program terminates: for loops have small bounds and loop variables
+    are never assigned, and while loops count a dedicated variable up to a
+    small limit. Stores only index with loop variables or small literals so
+    arrays stay small, and multiplication always has a literal side so values
+    stay reasonably sized. Everything else (division by zero, reads past the
+    end, negative indices, stores that grow an array, arrays aliased by
+    `B <- A`, conditions that are not comparisons) is fair game.
+
+    With parallel set, top-level statements also include for loops that
+    parallel.analyze() accepts: maps over one array and `+`, min or max
+    reductions.
+    """
+
+    def __init__(self, rng, max_depth=3, parallel=False):
+        self.rng = rng
+        self.max_depth = max_depth
+        self.parallel = parallel
+        self.counters = 0
+
+    def program(self) -> Block:
+        self.counters = 0
+        body = self.block(0, [], 2, 6)
+        body.statements.append(ReturnStatement(self.result()))
+        params = [Identifier(name) for name in PARAMS]
+        return Block([FunctionStatement(Identifier("f"), params, body)])
+
+    def result(self):
+        return self.rng.choice(
+            [Identifier("A"), Identifier("B"), self.expression(2, [])]
+        )
+
+    def block(self, depth, loop_vars, low=1, high=3) -> Block:
+        statements = []
+        for _ in range(self.rng.randint(low, high)):
+            stmt = self.statement(depth, loop_vars)
+            statements += stmt if isinstance(stmt, list) else [stmt]
+        return Block(statements)
+
+    def statement(self, depth, loop_vars):
+        rng = self.rng
+        choices = ["assign", "assign", "store", "store", "call", "alias"]
+        if depth < self.max_depth:
+            choices += ["if", "if", "for", "for", "while"]
+        if depth > 0:
+            choices.append("return")
+        if self.parallel and depth == 0:
+            choices += ["parallel"] * 4
+        kind = rng.choice(choices)
+
+        if kind == "assign":
+            value = self.condition(loop_vars) if rng.random() < 0.2 else self.expression(2, loop_vars)
+            return Assignment(Identifier(rng.choice(SCALARS)), value)
+        if kind == "store":
+            array_access = ArrayAccess(Identifier(rng.choice(ARRAYS)), self.store_index(loop_vars))
+            return Assignment(array_access, self.expression(2, loop_vars))
+        if kind == "alias":
+            target, source = rng.sample(ARRAYS, 2)
+            return Assignment(Identifier(target), Identifier(source))
+        if kind == "call":
+            name = rng.choice(ARRAYS)
+            if rng.random() < 0.3:
+                return Call("sort", [Identifier(name)])
+            return Call(
+                "swap",
+                [Identifier(name), self.small_index(loop_vars), self.small_index(loop_vars)],
+            )
+        if kind == "if":
+            else_block = self.block(depth + 1, loop_vars) if rng.random() < 0.5 else None
+            return IfStatement(
+                self.condition(loop_vars), self.block(depth + 1, loop_vars), else_block
+            )
+        if kind == "for":
+            free = [v for v in LOOP_VARS if v not in loop_vars]
+            if not free:
+                return Assignment(Identifier(rng.choice(SCALARS)), self.expression(2, loop_vars))
+            var = free[0]
+            start = Literal(str(rng.randint(0, 2)))
+            end = rng.choice(
+                [
+                    Literal(str(rng.randint(-1, 6))),
+                    Identifier("n"),
+                    BinaryOp(Identifier("n"), "-", Literal("1")),
+                    BinaryOp(Call("length", [Identifier("A")]), "-", Literal("1")),
+                ]
+            )
+            body = self.block(depth + 1, loop_vars + [var])
+            return ForLoop(Assignment(Identifier(var), start), end, body)
+        if kind == "while":
+            counter = f"w{self.counters}"
+            self.counters += 1
+            body = self.block(depth + 1, loop_vars)
+            step = Assignment(Identifier(counter), BinaryOp(Identifier(counter), "+", Literal("1")))
+            body.statements.insert(rng.choice([0, len(body.statements)]), step)
+            limit = Literal(str(rng.randint(0, 5)))
+            loop = WhileLoop(BinaryOp(Identifier(counter), "<", limit), body)
+            return [Assignment(Identifier(counter), Literal("0")), loop]
+        if kind == "parallel":
+            return self.parallel_loop()
+        return ReturnStatement(self.expression(1, loop_vars))
+
+    def parallel_loop(self) -> ForLoop:
+        """A for loop over 0 to n - 1 whose iterations are independent"""
+        rng = self.rng
+        written, other = rng.sample(ARRAYS, 2)
+        reduced, private = rng.sample(SCALARS[1:], 2)
+        op = rng.choice(["+", "min", "max"])
+        var = LOOP_VARS[0]
+
+        def expression(depth, names):
+            kinds = ["literal", "shared", "loop", "own", "read"] + ["binary", "binary"] * (depth > 0)
+            kind = rng.choice(kinds)
+            if kind == "literal":
+                return Literal(str(rng.randint(-3, 9)))
+            if kind == "shared":
+                return Identifier(rng.choice(names))
+            if kind == "loop":
+                return Identifier(var)
+            if kind == "own":
+                return ArrayAccess(Identifier(written), Identifier(var))
+            if kind == "read":
+                return ArrayAccess(Identifier(other), self.store_index([var]))
+            operator = rng.choice(["+", "-", "*"])
+            left = expression(depth - 1, names)
+            right = expression(depth - 1, names)
+            if operator == "*":
+                right = Literal(str(rng.randint(-3, 3)))
+            return BinaryOp(left, operator, right)
+
+        names = ["x", "n"]
+        statements = []
+        if rng.random() < 0.3:
+            statements.append(Assignment(Identifier(private), expression(1, names)))
+            names.append(private)
+        for _ in range(rng.randint(1, 3)):
+            value = expression(2, names)
+            if rng.random() < 0.5:
+                store = Assignment(ArrayAccess(Identifier(written), Identifier(var)), value)
+                if rng.random() < 0.2:
+                    condition = BinaryOp(expression(1, names), "<", expression(1, names))
+                    store = IfStatement(condition, Block([store]), None)
+                statements.append(store)
+            elif op == "+":
+                statements.append(
+                    Assignment(Identifier(reduced), BinaryOp(Identifier(reduced), "+", value))
+                )
+            else:
+                compare = rng.choice(["<", ">"])
+                condition = BinaryOp(value, compare, Identifier(reduced))
+                update = Assignment(Identifier(reduced), value)
+                statements.append(IfStatement(condition, Block([update]), None))
+        end = BinaryOp(Identifier("n"), "-", Literal("1"))
+        return ForLoop(Assignment(Identifier(var), Literal("0")), end, Block(statements))
+
+    def small_index(self, loop_vars):
+        if loop_vars and self.rng.random() < 0.6:
+            return Identifier(self.rng.choice(loop_vars))
+        return Literal(str(self.rng.randint(0, 3)))
+
+    def store_index(self, loop_vars):
+        index = self.small_index(loop_vars)
+        if isinstance(index, Identifier) and self.rng.random() < 0.3:
+            return BinaryOp(index, "+", Literal("1"))
+        return index
+
+    def condition(self, loop_vars):
+        rng = self.rng
+        if rng.random() < 0.2:
+            # Branches on whatever comparison ran last.
+            return self.expression(1, loop_vars)
+        op = rng.choice(["<", ">", "<=", ">=", "=", "!="])
+        cond = BinaryOp(self.expression(1, loop_vars), op, self.expression(1, loop_vars))
+        if rng.random() < 0.1:
+            cond = BinaryOp(cond, rng.choice(["and", "or"]), self.condition(loop_vars))
+        return cond
+
+    def expression(self, depth, loop_vars):
+        rng = self.rng
+        leaves = ["literal", "scalar", "scalar", "read"] + ["loop"] * bool(loop_vars)
+        kind = rng.choice(leaves + ["binary", "binary", "call"] * (depth > 0))
+
+        if kind == "literal":
+            return Literal(str(rng.randint(-3, 9)))
+        if kind == "scalar":
+            return Identifier(rng.choice(SCALARS + ("n",)))
+        if kind == "loop":
+            return Identifier(rng.choice(loop_vars))
+        if kind == "read":
+            index = self.expression(0, loop_vars) if depth else self.small_index(loop_vars)
+            return ArrayAccess(Identifier(rng.choice(ARRAYS)), index)
+        if kind == "call":
+            name = rng.choice(["length", "min", "max"])
+            if name == "length":
+                return Call(name, [Identifier(rng.choice(ARRAYS))])
+            return Call(
+                name,
+                [self.expression(depth - 1, loop_vars), self.expression(depth - 1, loop_vars)],
+            )
+        op = rng.choice(["+", "-", "*", "/"])
+        left = self.expression(depth - 1, loop_vars)
+        right = self.expression(depth - 1, loop_vars)
+        if op == "*":
+            right = Literal(str(rng.randint(-3, 3)))
+        return BinaryOp(left, op, right)
+
+
+def random_inputs(rng, parallel=False) -> dict:
+    if parallel:
+        # Arrays at least n long, so loops up to n - 1 stay in bounds.
+        size = rng.randint(2, 8)
+        return {
+            "A": [rng.randint(-5, 9) for _ in range(size)],
+            "B": [rng.randint(-5, 9) for _ in range(size)],
+            "n": rng.randint(0, size),
+            "x": rng.randint(-3, 9),
+        }
+    return {
+        "A": [rng.randint(-5, 9) for _ in range(rng.randint(0, 8))],
+        "B": [rng.randint(-5, 9) for _ in range(rng.randint(0, 4))],
+        "n": rng.randint(0, 8),
+        "x": rng.randint(-3, 9),
+    }
+
+
+class TooLong(Exception):
+    """The reference run did not finish within MAX_STEPS instructions"""
+
+
+def _reference(ast, inputs):
+    vm = VM(Generator().generate(ast))
+    vm.start(**inputs)
+    if vm.run_for(MAX_STEPS) is Status.RUNNING:
+        raise TooLong
+    return vm.return_value
+
+
+def _vm(**options):
+    def run(ast, inputs):
+        return VM(Generator().generate(ast), **options).run(**inputs)
+
+    return run
+
+
+def _jit(verify):
+    def run(ast, inputs):
+        # Repeated runs share the bound VM, so loops become hot and get traced.
+        vm = VM(Generator().generate(ast), verify=verify, jit=True)
+        for _ in range(JIT_RUNS):
+            vm.run(**_copy(inputs))
+        return vm.run(**inputs)
+
+    return run
+
+
+def _metered(ast, inputs):
+    from metering import MeteredVM
+
+    return MeteredVM(Generator().generate(ast), verify=True).run(**inputs)
+
+
+def _sliced(verify, jit=False):
+    def run(ast, inputs):
+        vm = VM(Generator().generate(ast), verify=verify, jit=jit)
+        for _ in range(JIT_RUNS if jit else 0):
+            vm.run(**_copy(inputs))
+        vm.start(**inputs)
+        while vm.run_for(SLICE) is Status.RUNNING:
+            pass
+        return vm.return_value
+
+    return run
+
+
+def _resumed(**options):
+    def run(ast, inputs):
+        # Snapshot after a few instructions and finish the run in a fresh VM,
+        # then copy the resumed arrays into the input lists they were loaded
+        # from, so outcome() sees the same mutations as an uninterrupted run.
+        instructions = Generator().generate(ast)
+        vm = VM(instructions, **options)
+        vm.start(**inputs)
+        if vm.run_for(RESUME_AFTER) is Status.DONE:
+            return vm.return_value
+        owners = {
+            id(value): name
+            for name, value in vm.variables.items()
+            if any(value is original for original in inputs.values() if isinstance(original, list))
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot")
+            vm.snapshot(path)
+            resumed = VM(instructions, **options)
+            resumed.restore(path)
+        loaded = [
+            (original, resumed.variables[owners[id(original)]])
+            for original in inputs.values()
+            if id(original) in owners
+        ]
+        while resumed.run_for(MAX_STEPS) is Status.RUNNING:
+            pass
+        for original, values in loaded:
+            original[:] = values
+        return resumed.return_value
+
+    return run
+
+
+def _session(ast, inputs):
+    """Compile through a CompilerSession edited into a shrunk variant of the program and back"""
+    from session import CompilerSession
+
+    source = unparse(ast)
+    variants = list(_shrink_block(ast))
+    session = CompilerSession(source)
+    if variants:
+        variant = random.Random(zlib.crc32(source.encode())).choice(variants)
+        _edit(session, unparse(variant).split("\n"))
+        _edit(session, source.split("\n"))
+    return VM(session.instructions).run(**inputs)
+
+
+def _edit(session, lines):
+    """Turn a session's source into lines with a single edit of the lines that differ"""
+    old = session.lines
+    if old == lines:
+        return
+    prefix = 0
+    while prefix < min(len(old), len(lines)) and old[prefix] == lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < min(len(old), len(lines)) - prefix
+        and old[len(old) - 1 - suffix] == lines[len(lines) - 1 - suffix]
+    ):
+        suffix += 1
+    session.edit(prefix, len(old) - suffix, "\n".join(lines[prefix : len(lines) - suffix]))
+
+
+def _bytecode(ast, inputs):
+    return VM(loads(dumps(Generator().generate(ast)))).run(**inputs)
+
+
+def _level(opt_level, **options):
+    def run(ast, inputs):
+        from main import compile_tree
+
+        return VM(compile_tree(ast, opt_level), **options).run(**inputs)
+
+    return run
+
+
+def _layout(**options):
+    def run(ast, inputs):
+        from optimizer import optimize
+
+        return VM(optimize(Generator().generate(ast)), **options).run(**inputs)
+
+    return run
+
+
+def _parallel(ast, inputs):
+    from parallel import ParallelVM, compile_parallel
+
+    instructions, loops = compile_parallel(ast)
+    with ParallelVM(instructions, loops, workers=2, threshold=0) as vm:
+        return vm.run(**inputs)
+
+
+ENGINES = {
+    "verified": _vm(verify=True),
+    "jit": _jit(verify=True),
+    "jit-guarded": _jit(verify=False),
+    "metered": _metered,
+    "sliced": _sliced(verify=False),
+    "sliced-verified": _sliced(verify=True),
+    "sliced-verified-jit": _sliced(verify=True, jit=True),
+    "resumed": _resumed(),
+    "resumed-verified-jit": _resumed(verify=True, jit=True),
+    "session": _session,
+    "bytecode": _bytecode,
+    "O1": _level(1),
+    "O2": _level(2),
+    "O2-verified-jit": _level(2, verify=True, jit=True),
+    "layout": _layout(),
+    "layout-verified-jit": _layout(verify=True, jit=True),
+}
+OPTIONAL_ENGINES = {"parallel": _parallel}
+
+
+def _copy(inputs) -> dict:
+    return {name: list(value) if isinstance(value, list) else value for name, value in inputs.items()}
+
+
+def _normalize(value):
+    if isinstance(value, (list, array.array, memoryview)):
+        return ("array", list(value))
+    return (type(value).__name__, value)
+
+
+def outcome(engine, ast, inputs):
+    """What a run produced: the return value and final input arrays, or the error type"""
+    args = _copy(inputs)
+    try:
+        value = engine(ast, args)
+    except TooLong:
+        raise
+    except Exception as e:
+        return ("error", type(e).__name__)
+    arrays = {name: list(v) for name, v in args.items() if isinstance(v, list)}
+    return ("ok", _normalize(value), arrays)
+
+
+def check(ast, inputs, engines) -> dict | None:
+    """Outcomes of every engine that disagrees with the reference, or None if it ran too long"""
+    try:
+        expected = outcome(_reference, ast, inputs)
+    except TooLong:
+        return None
+    mismatches = {}
+    for name, engine in engines.items():
+        result = outcome(engine, ast, inputs)
+        if result != expected:
+            mismatches[name] = result
+    if mismatches:
+        mismatches["reference"] = expected
+    return mismatches
+
+
+def _shrink_expression(node):
+    """Smaller variants of an expression"""
+    if not (isinstance(node, Literal) and node.value == "0"):
+        yield Literal("0")
+    if isinstance(node, BinaryOp):
+        yield node.left
+        yield node.right
+        for left in _shrink_expression(node.left):
+            yield BinaryOp(left, node.operator, node.right)
+        for right in _shrink_expression(node.right):
+            yield BinaryOp(node.left, node.operator, right)
+    elif isinstance(node, ArrayAccess):
+        for index in _shrink_expression(node.index):
+            yield ArrayAccess(node.array, index)
+    elif isinstance(node, Call):
+        for i, arg in enumerate(node.args):
+            for smaller in _shrink_expression(arg):
+                yield Call(node.name, node.args[:i] + [smaller] + node.args[i + 1 :])
+
+
+def _shrink_block(block):
+    """Smaller variants of a block, as new Blocks"""
+    statements = block.statements
+    for i in range(len(statements)):
+        yield Block(statements[:i] + statements[i + 1 :])
+    for i, stmt in enumerate(statements):
+        for replacement in _shrink_statement(stmt):
+            yield Block(statements[:i] + replacement + statements[i + 1 :])
+
+
+def _shrink_statement(node):
+    """Smaller variants of a statement, each a list of statements to splice in"""
+    if isinstance(node, FunctionStatement):
+        for body in _shrink_block(node.body):
+            yield [FunctionStatement(node.name, node.param_ids, body)]
+    elif isinstance(node, IfStatement):
+        yield node.then_block.statements
+        if node.else_block:
+            yield node.else_block.statements
+            yield [IfStatement(node.condition, node.then_block, None)]
+        for cond in _shrink_expression(node.condition):
+            yield [IfStatement(cond, node.then_block, node.else_block)]
+        for then_block in _shrink_block(node.then_block):
+            yield [IfStatement(node.condition, then_block, node.else_block)]
+        if node.else_block:
+            for else_block in _shrink_block(node.else_block):
+                yield [IfStatement(node.condition, node.then_block, else_block)]
+    elif isinstance(node, WhileLoop):
+        yield node.body.statements
+        for body in _shrink_block(node.body):
+            yield [WhileLoop(node.condition, body)]
+    elif isinstance(node, ForLoop):
+        yield [node.assignment] + node.body.statements
+        for end in _shrink_expression(node.end):
+            yield [ForLoop(node.assignment, end, node.body)]
+        for body in _shrink_block(node.body):
+            yield [ForLoop(node.assignment, node.end, body)]
+    elif isinstance(node, Assignment):
+        for value in _shrink_expression(node.value):
+            yield [Assignment(node.target, value)]
+        if isinstance(node.target, ArrayAccess):
+            for index in _shrink_expression(node.target.index):
+                yield [Assignment(ArrayAccess(node.target.array, index), node.value)]
+    elif isinstance(node, ReturnStatement):
+        for value in _shrink_expression(node.value):
+            yield [ReturnStatement(value)]
+    elif isinstance(node, Call):
+        for smaller in _shrink_expression(node):
+            if isinstance(smaller, Call):
+                yield [smaller]
+
+
+def _shrink_inputs(inputs):
+    for name, value in inputs.items():
+        if isinstance(value, list):
+            for i in range(len(value)):
+                yield {**inputs, name: value[:i] + value[i + 1 :]}
+            for i, item in enumerate(value):
+                if item != 0:
+                    yield {**inputs, name: value[:i] + [0] + value[i + 1 :]}
+        elif value != 0:
+            yield {**inputs, name: 0}
+
+
+def minimize(ast, inputs, engines):
+    """Greedily shrink a failing program and its inputs while some engine still disagrees"""
+    budget = MAX_SHRINK_STEPS
+
+    def fails(candidate_ast, candidate_inputs):
+        nonlocal budget
+        budget -= 1
+        return bool(check(candidate_ast, candidate_inputs, engines))
+
+    progress = True
+    while progress and budget > 0:
+        progress = False
+        for candidate in _shrink_block(ast):
+            if budget <= 0:
+                break
+            if fails(candidate, inputs):
+                ast, progress = candidate, True
+                break
+        if progress:
+            continue
+        for candidate in _shrink_inputs(inputs):
+            if budget <= 0:
+                break
+            if fails(ast, candidate):
+                inputs, progress = candidate, True
+                break
+    return ast, inputs
+
+
+class Failure:
+    """A program and inputs on which some engines disagree with the reference"""
+
+    def __init__(self, seed, ast, inputs, mismatches):
+        self.seed = seed
+        self.ast = ast
+        self.inputs = inputs
+        self.mismatches = mismatches
+
+    def __str__(self):
+        lines = [f"seed {self.seed}: inputs {self.inputs}", unparse(self.ast)]
+        lines += [f"  {name}: {result}" for name, result in self.mismatches.items()]
+        return "\n".join(lines)
+
+
+def fuzz(iterations=200, seed=0, engines=None, shrink=True, log=None) -> list[Failure]:
+    """Run random programs on every engine, returning minimized failures"""
+    engines = ENGINES if engines is None else engines
+    failures = []
+    for case in range(seed, seed + iterations):
+        rng = random.Random(case)
+        # With the pool among the engines, every other program has loops it can run.
+        parallel = case % 2 == 1 and any(name in engines for name in OPTIONAL_ENGINES)
+        ast = ProgramGenerator(rng, parallel=parallel).program()
+        inputs = random_inputs(rng, parallel)
+        mismatches = check(ast, inputs, engines)
+        if not mismatches:
+            continue
+        if shrink:
+            failing = {name: engines[name] for name in mismatches if name in engines}
+            ast, inputs = minimize(ast, inputs, failing)
+            mismatches = check(ast, inputs, engines) or mismatches
+        failure = Failure(case, ast, inputs, mismatches)
+        failures.append(failure)
+        if log is not None:
+            log(str(failure))
+    return failures
@@ -7,6 +7,7 @@ from parser import (
     ArrayAccess,
     BinaryOp,
     UnaryOp,
+    Call,
     Assignment,
     IfStatement,
     WhileLoop,
@@ -24,6 +25,7 @@ class Generator:
         self.instructions = []
         self.temp_counter = 0
         self.label_counter = 0
+        self.base = 0
 
     def new_temp(self) -> str:
         """Allocate a new temporary register"""
@@ -41,15 +43,32 @@ class Generator:
         """Emit a new instruction"""
         self.instructions.append(Instruction(opcode, *operands))
 
+    def position(self) -> int:
+        """Absolute index of the next emitted instruction, used as a jump target"""
+        return self.base + len(self.instructions)
+
     def generate(self, ast: Block) -> list[Instruction]:
         """Generate opcodes from AST"""
         self.instructions = []
         self.temp_counter = 0
         self.label_counter = 0
+        self.base = 0
 
         self.visit_block(ast)
         return self.instructions
 
+    def generate_at(self, node: ASTNode, base: int) -> list[Instruction]:
+        """Generate opcodes for a single statement that will be placed at index base.
+
+        Temporaries keep counting from earlier calls so regenerated code never
+        reuses a name still live elsewhere in the program.
+        """
+        self.instructions = []
+        self.base = base
+
+        self.visit(node)
+        return self.instructions
+
     def visit_block(self, node: Block):
         """Visit a block of statements"""
         for stmt in node.statements:
@@ -67,6 +86,8 @@ class Generator:
             return self.visit_binary_op(node)
         elif isinstance(node, UnaryOp):
             return self.visit_unary_op(node)
+        elif isinstance(node, Call):
+            return self.visit_call(node)
         elif isinstance(node, Assignment):
             return self.visit_assignment(node)
         elif isinstance(node, IfStatement):
@@ -130,6 +151,13 @@ class Generator:
         self.emit(OpCode.AOP, node.operator, operand, temp)
         return temp
 
+    def visit_call(self, node: Call) -> str:
+        """Visit intrinsic call - emit CAL with the arguments and a result temp"""
+        args = [self.visit(arg) for arg in node.args]
+        temp = self.new_temp()
+        self.emit(OpCode.CAL, node.name, *args, temp)
+        return temp
+
     def visit_assignment(self, node: Assignment) -> None:
         """Visit assignment - emit ASN"""
         value = self.visit(node.value)
@@ -170,7 +198,7 @@ class Generator:
             then_size = jmp_idx - then_start + 1
             self.instructions[skp_idx] = Instruction(OpCode.SKP, then_size)
 
-            end_idx = len(self.instructions)
+            end_idx = self.position()
             self.instructions[jmp_idx] = Instruction(OpCode.JMP, end_idx)
         else:
 
@@ -179,7 +207,7 @@ class Generator:
 
     def visit_while_loop(self, node: WhileLoop) -> None:
         """Visit while loop - emit condition check with SKP and JMP back"""
-        loop_start = len(self.instructions)
+        loop_start = self.position()
 
         condition = self.visit(node.condition)
 
@@ -199,7 +227,7 @@ class Generator:
 
         self.visit(node.assignment)
 
-        loop_start = len(self.instructions)
+        loop_start = self.position()
 
         loop_var = (
             node.assignment.target.name
@@ -0,0 +1,62 @@
+class Intrinsic:
+    """A Python function the VM runs natively for a CAL instruction"""
+
+    def __init__(self, name, function, arity=None, aliases=True):
+        self.name = name
+        self.function = function
+        self.arity = arity
+        self.aliases = aliases
+
+
+INTRINSICS = {}
+
+
+def register_intrinsic(name, function=None, arity=None, aliases=True):
+    """Make function callable from programs as name(args...).
+
+    Arguments arrive as register values, so arrays are passed by reference
+    and may be modified in place, and the return value is stored in the
+    call's result register. Intrinsics must not change an array's length:
+    the verifier's bounds proofs rely on it. arity, if given, is checked at
+    verification time. Pass aliases=False if the result is never one of the
+    array arguments, so passing an array does not count as copying it.
+    Usable as a decorator when function is omitted.
+    """
+    if not name.isidentifier():
+        raise ValueError(f"Invalid intrinsic name: {name!r}")
+    if function is None:
+        return lambda f: register_intrinsic(name, f, arity, aliases)
+    INTRINSICS[name] = Intrinsic(name, function, arity, aliases)
+    return function
+
+
+def lookup(name) -> Intrinsic:
+    try:
+        return INTRINSICS[name]
+    except KeyError:
+        raise NameError(f"Unknown intrinsic: {name}") from None
+
+
+def namespace() -> dict:
+    """Intrinsic functions keyed by the names decoded instructions call them by"""
+    return {f"intrinsic_{name}": i.function for name, i in INTRINSICS.items()}
+
+
+def _swap(values, i, j):
+    values[i], values[j] = values[j], values[i]
+    return 0
+
+
+def _sort(values):
+    if isinstance(values, list):
+        values.sort()
+    else:
+        values[:] = type(values)(values.typecode, sorted(values))
+    return 0
+
+
+register_intrinsic("length", len, 1, aliases=False)
+register_intrinsic("swap", _swap, 3, aliases=False)
+register_intrinsic("sort", _sort, 1, aliases=False)
+register_intrinsic("min", min)
+register_intrinsic("max", max)
@@ -0,0 +1,871 @@
+from itertools import count
+
+from opcodes import OpCode, Instruction, parse_operand
+from parser import (
+    ASTNode,
+    Literal,
+    Identifier,
+    ArrayAccess,
+    BinaryOp,
+    Call,
+    Assignment,
+    IfStatement,
+    WhileLoop,
+    ForLoop,
+    ReturnStatement,
+    Block,
+    FunctionStatement,
+)
+
+ARITHMETIC = {"+", "-", "*", "/"}
+COMMUTATIVE = {"+", "*", "=", "!="}
+FOLD = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a // b,
+}
+COMPARE = {
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+}
+# Pseudo-variable holding the result of the latest comparison, which SKP
+# tests. Conditions that are not comparisons branch on it, like the VM does.
+FLAG = "%cmp"
+
+
+class Value:
+    """An SSA value: the result of an Op, or the entry value of a variable"""
+
+    _numbers = count()
+
+    def __init__(self, op=None, name=None):
+        self.op = op
+        self.name = name
+        self.number = next(Value._numbers)
+
+    def __repr__(self):
+        return self.name or f"%{self.number}"
+
+
+class Op:
+    """One IR operation.
+
+    kind is one of aop, com, idx, store, load, assign, call or phi. Calls
+    name their intrinsic in ``operator``. idx, store, load and assign act on
+    the array variable named by ``array``, which is kept in memory instead of
+    being renamed into SSA values. Phis keep their operands in ``incoming``,
+    keyed by predecessor block.
+    """
+
+    def __init__(self, kind, operator=None, args=(), array=None, result=True):
+        self.kind = kind
+        self.operator = operator
+        self.args = list(args)
+        self.array = array
+        self.incoming = {}
+        self.block = None
+        self.result = Value(self) if result else None
+
+    def operands(self) -> list:
+        return list(self.incoming.values()) if self.kind == "phi" else self.args
+
+    @property
+    def pure(self) -> bool:
+        """Whether the op can be removed when unused"""
+        if self.kind in ("store", "assign", "call"):
+            return False
+        if self.kind == "aop" and self.operator == "/":
+            divisor = self.args[1]
+            return isinstance(divisor, int) and divisor != 0
+        if self.kind == "idx":
+            # Indices below -len(array) raise IndexError.
+            index = self.args[0]
+            return isinstance(index, int) and index >= 0
+        return True
+
+    def __repr__(self):
+        if self.kind == "phi":
+            args = ", ".join(f"b{b.index}: {v!r}" for b, v in self.incoming.items())
+            return f"{self.result!r} = phi {self.array or ''}({args})"
+        args = " ".join(repr(a) for a in self.args)
+        prefix = f"{self.result!r} = " if self.result else ""
+        array = f" {self.array}" if self.array else ""
+        operator = f" {self.operator}" if self.operator else ""
+        return f"{prefix}{self.kind}{operator}{array} {args}".rstrip()
+
+
+class Jump:
+    def __init__(self, target):
+        self.target = target
+
+    def successors(self):
+        return [self.target]
+
+
+class Branch:
+    """Go to true_block if cond is truthy, else false_block.
+
+    cond is the comparison flag at the end of the block, not the value of the
+    source condition.
+    """
+
+    def __init__(self, cond, true_block, false_block):
+        self.cond = cond
+        self.true_block = true_block
+        self.false_block = false_block
+
+    def successors(self):
+        return [self.true_block, self.false_block]
+
+
+class Return:
+    def __init__(self, value=None):
+        self.value = value
+
+    def successors(self):
+        return []
+
+
+class BasicBlock:
+    def __init__(self, index):
+        self.index = index
+        self.preds = []
+        self.phis = []
+        self.ops = []
+        self.term = None
+
+    def successors(self):
+        return self.term.successors() if self.term else []
+
+
+class Function:
+    """A control flow graph of basic blocks in SSA form"""
+
+    def __init__(self, entry, blocks):
+        self.entry = entry
+        self.blocks = blocks
+
+    def __str__(self):
+        lines = []
+        for block in self.blocks:
+            preds = ", ".join(f"b{p.index}" for p in block.preds)
+            lines.append(f"b{block.index}:  ; preds {preds}")
+            lines.extend(f"    {op!r}" for op in block.phis + block.ops)
+            term = block.term
+            if isinstance(term, Jump):
+                lines.append(f"    jump b{term.target.index}")
+            elif isinstance(term, Branch):
+                lines.append(
+                    f"    branch {term.cond!r} b{term.true_block.index} b{term.false_block.index}"
+                )
+            elif isinstance(term, Return):
+                lines.append(f"    return {'' if term.value is None else repr(term.value)}")
+        return "\n".join(lines)
+
+
+def array_names(node) -> set[str]:
+    """Names used as arrays anywhere in an AST"""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ArrayAccess) and isinstance(node.array, Identifier):
+            names.add(node.array.name)
+        if isinstance(node, ASTNode):
+            stack.extend(vars(node).values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return names
+
+
+class Builder:
+    """Builds SSA directly from the AST.
+
+    Uses the on-the-fly construction of Braun et al.: variables are read
+    through their definitions per block, and blocks whose predecessors are
+    not all known yet get placeholder phis that are completed when sealed.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.defs = {}
+        self.incomplete = {}
+        self.sealed = set()
+        self.inputs = {}
+        self.arrays = set()
+        self.block = None
+
+    def build(self, ast: Block) -> Function:
+        self.arrays = array_names(ast)
+        entry = self.new_block()
+        self.seal(entry)
+        self.block = entry
+        self.write(FLAG, entry, 0)
+
+        self.visit(ast)
+        if self.block.term is None:
+            self.block.term = Return()
+        return Function(entry, self.blocks)
+
+    def new_block(self) -> BasicBlock:
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def terminate(self, term):
+        if self.block.term is not None:
+            return
+        self.block.term = term
+        for succ in term.successors():
+            succ.preds.append(self.block)
+
+    def unreachable(self):
+        """Continue in a fresh block that nothing jumps to"""
+        self.block = self.new_block()
+        self.seal(self.block)
+
+    def emit(self, kind, operator=None, args=(), array=None, result=True):
+        op = Op(kind, operator, args, array, result)
+        op.block = self.block
+        self.block.ops.append(op)
+        return op.result
+
+    def write(self, name, block, value):
+        self.defs.setdefault(name, {})[block] = value
+
+    def read(self, name, block):
+        if block in self.defs.get(name, {}):
+            return self.defs[name][block]
+
+        if block not in self.sealed:
+            phi = self.new_phi(name, block)
+            self.incomplete.setdefault(block, {})[name] = phi
+            value = phi.result
+        elif not block.preds:
+            value = self.inputs.setdefault(name, Value(name=name))
+        elif len(block.preds) == 1:
+            value = self.read(name, block.preds[0])
+        else:
+            phi = self.new_phi(name, block)
+            self.write(name, block, phi.result)
+            self.add_phi_operands(name, phi)
+            value = phi.result
+        self.write(name, block, value)
+        return value
+
+    def new_phi(self, name, block):
+        phi = Op("phi", array=name)
+        phi.block = block
+        block.phis.append(phi)
+        return phi
+
+    def add_phi_operands(self, name, phi):
+        for pred in phi.block.preds:
+            phi.incoming[pred] = self.read(name, pred)
+
+    def seal(self, block):
+        for name, phi in self.incomplete.pop(block, {}).items():
+            self.add_phi_operands(name, phi)
+        self.sealed.add(block)
+
+    def read_variable(self, name):
+        if name in self.arrays:
+            return self.emit("load", array=name)
+        return self.read(name, self.block)
+
+    def write_variable(self, name, value):
+        if name in self.arrays:
+            self.emit("assign", args=[value], array=name, result=False)
+        else:
+            self.write(name, self.block, value)
+
+    def visit(self, node):
+        if isinstance(node, Block):
+            for stmt in node.statements:
+                self.visit(stmt)
+        elif isinstance(node, FunctionStatement):
+            self.visit(node.body)
+            self.terminate(Return())
+            self.unreachable()
+        elif isinstance(node, Assignment):
+            self.visit_assignment(node)
+        elif isinstance(node, IfStatement):
+            self.visit_if_statement(node)
+        elif isinstance(node, WhileLoop):
+            self.visit_while_loop(node)
+        elif isinstance(node, ForLoop):
+            self.visit_for_loop(node)
+        elif isinstance(node, ReturnStatement):
+            value = self.expression(node.value) if node.value else None
+            self.terminate(Return(value))
+            self.unreachable()
+        else:
+            self.expression(node)
+
+    def expression(self, node):
+        if isinstance(node, Literal):
+            value = parse_operand(node.value)
+            return value if isinstance(value, int) else self.read_variable(value)
+        elif isinstance(node, Identifier):
+            return self.read_variable(node.name)
+        elif isinstance(node, ArrayAccess):
+            if not isinstance(node.array, Identifier):
+                raise ValueError(f"Unsupported array expression: {node.array}")
+            index = self.expression(node.index)
+            return self.emit("idx", args=[index], array=node.array.name)
+        elif isinstance(node, BinaryOp):
+            left = self.expression(node.left)
+            right = self.expression(node.right)
+            if node.operator in ARITHMETIC:
+                return self.emit("aop", node.operator, [left, right])
+            elif node.operator in COMPARE or node.operator in ("and", "or"):
+                result = self.emit("com", node.operator, [left, right])
+                self.write(FLAG, self.block, result)
+                return result
+            raise ValueError(f"Unknown operator: {node.operator}")
+        elif isinstance(node, Call):
+            args = [self.expression(arg) for arg in node.args]
+            return self.emit("call", node.name, args)
+        raise ValueError(f"Unsupported expression: {node}")
+
+    def visit_assignment(self, node: Assignment):
+        value = self.expression(node.value)
+        target = node.target
+        if isinstance(target, Identifier):
+            self.write_variable(target.name, value)
+        elif isinstance(target, ArrayAccess) and isinstance(target.array, Identifier):
+            index = self.expression(target.index)
+            self.emit("store", args=[index, value], array=target.array.name, result=False)
+        else:
+            raise ValueError(f"Invalid assignment target: {type(target)}")
+
+    def condition(self, node):
+        """Evaluate a branch condition and return the comparison flag it leaves"""
+        self.expression(node)
+        return self.read(FLAG, self.block)
+
+    def visit_if_statement(self, node: IfStatement):
+        cond = self.condition(node.condition)
+        then_block = self.new_block()
+        join = self.new_block()
+        else_block = self.new_block() if node.else_block else join
+        self.terminate(Branch(cond, then_block, else_block))
+        self.seal(then_block)
+
+        self.block = then_block
+        self.visit(node.then_block)
+        self.terminate(Jump(join))
+
+        if node.else_block:
+            self.seal(else_block)
+            self.block = else_block
+            self.visit(node.else_block)
+            self.terminate(Jump(join))
+
+        self.seal(join)
+        self.block = join
+
+    def visit_while_loop(self, node: WhileLoop):
+        header = self.new_block()
+        self.terminate(Jump(header))
+        self.block = header
+        cond = self.condition(node.condition)
+        self.loop(header, cond, node.body, None)
+
+    def visit_for_loop(self, node: ForLoop):
+        self.visit(node.assignment)
+        target = node.assignment.target
+        if not isinstance(target, Identifier):
+            raise ValueError(f"Invalid loop variable: {target}")
+
+        header = self.new_block()
+        self.terminate(Jump(header))
+        self.block = header
+        end = self.expression(node.end)
+        cond = self.emit("com", "<=", [self.read_variable(target.name), end])
+        self.write(FLAG, header, cond)
+        self.loop(header, cond, node.body, target.name)
+
+    def loop(self, header, cond, body_node, counter):
+        body = self.new_block()
+        exit_block = self.new_block()
+        self.terminate(Branch(cond, body, exit_block))
+        self.seal(body)
+
+        self.block = body
+        self.visit(body_node)
+        if counter is not None and self.block.term is None:
+            increment = self.emit("aop", "+", [self.read_variable(counter), 1])
+            self.write_variable(counter, increment)
+        self.terminate(Jump(header))
+
+        self.seal(header)
+        self.seal(exit_block)
+        self.block = exit_block
+
+
+def build(ast: Block) -> Function:
+    """Build the SSA control flow graph of a program"""
+    return Builder().build(ast)
+
+
+def _all_ops(function):
+    for block in function.blocks:
+        yield from block.phis
+        yield from block.ops
+
+
+def _substitute(function, replacements):
+    """Rewrite every use of a replaced value, following chains of replacements"""
+    if not replacements:
+        return
+
+    def resolve(value):
+        while isinstance(value, Value) and value in replacements:
+            value = replacements[value]
+        return value
+
+    for block in function.blocks:
+        for op in block.phis:
+            op.incoming = {pred: resolve(v) for pred, v in op.incoming.items()}
+        for op in block.ops:
+            op.args = [resolve(a) for a in op.args]
+        if isinstance(block.term, Branch):
+            block.term.cond = resolve(block.term.cond)
+        elif isinstance(block.term, Return) and block.term.value is not None:
+            block.term.value = resolve(block.term.value)
+
+
+def reverse_postorder(function) -> list[BasicBlock]:
+    """Reachable blocks in reverse postorder, true successors first"""
+    return _postorder(function.entry)[::-1]
+
+
+def _postorder(entry) -> list[BasicBlock]:
+    # Successors are explored false side first, so the true side finishes
+    # last and comes right after its branch in reverse postorder.
+    order = []
+    seen = {entry}
+    stack = [(entry, iter(entry.successors()[::-1]))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(succ.successors()[::-1])))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    return order
+
+
+def remove_unreachable(function):
+    """Drop blocks the entry cannot reach and the edges they contributed"""
+    reachable = set(_postorder(function.entry))
+    function.blocks = [b for b in function.blocks if b in reachable]
+    for block in function.blocks:
+        block.preds = [p for p in block.preds if p in reachable]
+        for phi in block.phis:
+            phi.incoming = {p: v for p, v in phi.incoming.items() if p in reachable}
+
+
+def remove_trivial_phis(function):
+    """Replace phis whose operands are all the same value (or the phi itself)"""
+    replacements = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in function.blocks:
+            for phi in list(block.phis):
+                seen = set()
+                for value in phi.incoming.values():
+                    while isinstance(value, Value) and value in replacements:
+                        value = replacements[value]
+                    if value is not phi.result:
+                        seen.add(value if isinstance(value, Value) else ("const", value))
+                if len(seen) <= 1:
+                    (same,) = seen or {("const", 0)}
+                    if isinstance(same, tuple):
+                        same = same[1]
+                    replacements[phi.result] = same
+                    block.phis.remove(phi)
+                    changed = True
+    _substitute(function, replacements)
+
+
+def fold_constants(function):
+    """Fold arithmetic on constants and branches on constant conditions"""
+    replacements = {}
+    for block in function.blocks:
+        for op in list(block.ops):
+            if op.kind == "aop" and all(isinstance(a, int) for a in op.args):
+                left, right = op.args
+                if op.operator == "/" and right == 0:
+                    continue
+                replacements[op.result] = FOLD[op.operator](left, right)
+                block.ops.remove(op)
+    _substitute(function, replacements)
+
+    for block in function.blocks:
+        term = block.term
+        if not isinstance(term, Branch):
+            continue
+        cond = term.cond
+        if isinstance(cond, int):
+            taken = bool(cond)
+        elif (
+            cond.op is not None
+            and cond.op.kind == "com"
+            and cond.op.operator in COMPARE
+            and all(isinstance(a, int) for a in cond.op.args)
+        ):
+            taken = COMPARE[cond.op.operator](*cond.op.args)
+        else:
+            continue
+        kept, dropped = (
+            (term.true_block, term.false_block) if taken else (term.false_block, term.true_block)
+        )
+        block.term = Jump(kept)
+        if dropped is not kept:
+            dropped.preds.remove(block)
+            for phi in dropped.phis:
+                phi.incoming.pop(block, None)
+    remove_unreachable(function)
+
+
+def dominators(function) -> dict:
+    """Immediate dominator of every reachable block (Cooper, Harvey and Kennedy)"""
+    order = reverse_postorder(function)
+    position = {block: i for i, block in enumerate(order)}
+    idom = {function.entry: function.entry}
+
+    def intersect(a, b):
+        while a is not b:
+            while position[a] > position[b]:
+                a = idom[a]
+            while position[b] > position[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            preds = [p for p in block.preds if p in idom]
+            new = preds[0]
+            for pred in preds[1:]:
+                new = intersect(pred, new)
+            if idom.get(block) is not new:
+                idom[block] = new
+                changed = True
+    return idom
+
+
+def _dominates(idom, a, b) -> bool:
+    while b is not a:
+        if idom[b] is b:
+            return False
+        b = idom[b]
+    return True
+
+
+def value_numbering(function):
+    """Global value numbering of pure arithmetic and comparisons over the dominator tree"""
+    idom = dominators(function)
+    children = {}
+    for block, parent in idom.items():
+        if block is not parent:
+            children.setdefault(parent, []).append(block)
+
+    def key(op):
+        args = [a if isinstance(a, int) else id(a) for a in op.args]
+        if op.operator in COMMUTATIVE:
+            args.sort(key=lambda a: (isinstance(a, int), a))
+        return op.kind, op.operator, tuple(args)
+
+    replacements = {}
+
+    def resolve(value):
+        while isinstance(value, Value) and value in replacements:
+            value = replacements[value]
+        return value
+
+    stack = [(function.entry, {})]
+    while stack:
+        block, table = stack.pop()
+        table = dict(table)
+        for op in list(block.ops):
+            op.args = [resolve(a) for a in op.args]
+            if op.kind not in ("aop", "com"):
+                continue
+            k = key(op)
+            if k in table:
+                replacements[op.result] = table[k]
+                block.ops.remove(op)
+            else:
+                table[k] = op.result
+        for child in children.get(block, []):
+            stack.append((child, table))
+    _substitute(function, replacements)
+
+
+def _loops(function, idom):
+    """Natural loops as (header, set of blocks), innermost first"""
+    loops = {}
+    for block in function.blocks:
+        for succ in block.successors():
+            if _dominates(idom, succ, block):
+                body = loops.setdefault(succ, {succ})
+                stack = [block]
+                while stack:
+                    node = stack.pop()
+                    if node not in body:
+                        body.add(node)
+                        stack.extend(node.preds)
+    return sorted(loops.items(), key=lambda item: len(item[1]))
+
+
+def hoist_invariants(function):
+    """Move loop-invariant pure arithmetic and comparisons into loop preheaders"""
+    idom = dominators(function)
+    for header, body in _loops(function, idom):
+        outside = [p for p in header.preds if p not in body]
+        if len(outside) != 1 or not isinstance(outside[0].term, Jump):
+            continue
+        preheader = outside[0]
+
+        changed = True
+        while changed:
+            changed = False
+            defined_inside = {
+                op.result for block in body for op in block.phis + block.ops if op.result
+            }
+            for block in function.blocks:
+                if block not in body:
+                    continue
+                for op in list(block.ops):
+                    if op.kind not in ("aop", "com") or not op.pure:
+                        continue
+                    if any(a in defined_inside for a in op.args if isinstance(a, Value)):
+                        continue
+                    block.ops.remove(op)
+                    op.block = preheader
+                    preheader.ops.append(op)
+                    defined_inside.discard(op.result)
+                    changed = True
+
+
+def eliminate_dead_code(function):
+    """Remove pure ops and phis whose results are never used"""
+    changed = True
+    while changed:
+        used = set()
+        for op in _all_ops(function):
+            used.update(a for a in op.operands() if isinstance(a, Value))
+        for block in function.blocks:
+            term = block.term
+            if isinstance(term, Branch) and isinstance(term.cond, Value):
+                used.add(term.cond)
+            elif isinstance(term, Return) and isinstance(term.value, Value):
+                used.add(term.value)
+
+        changed = False
+        for block in function.blocks:
+            for ops in (block.phis, block.ops):
+                for op in list(ops):
+                    if op.result is not None and op.result not in used and op.pure:
+                        ops.remove(op)
+                        changed = True
+
+
+def optimize(function: Function) -> Function:
+    """Run the SSA optimization pipeline"""
+    remove_unreachable(function)
+    remove_trivial_phis(function)
+    fold_constants(function)
+    remove_trivial_phis(function)
+    value_numbering(function)
+    hoist_invariants(function)
+    eliminate_dead_code(function)
+    return function
+
+
+def _split_critical_edges(function):
+    """Give every edge into a block with phis from a branching block its own block"""
+    for block in list(function.blocks):
+        term = block.term
+        if not isinstance(term, Branch):
+            continue
+        for attr in ("true_block", "false_block"):
+            succ = getattr(term, attr)
+            if not succ.phis:
+                continue
+            middle = BasicBlock(len(function.blocks))
+            function.blocks.append(middle)
+            middle.preds = [block]
+            middle.term = Jump(succ)
+            succ.preds[succ.preds.index(block)] = middle
+            for phi in succ.phis:
+                phi.incoming[middle] = phi.incoming.pop(block)
+            setattr(term, attr, middle)
+
+
+def _sequentialize(copies, temp):
+    """Order parallel copies (dst, src) so no source is overwritten before it is read"""
+    pending = [(dst, src) for dst, src in copies if dst != src]
+    result = []
+    while pending:
+        sources = {src for _, src in pending}
+        ready = [(dst, src) for dst, src in pending if dst not in sources]
+        if ready:
+            for copy in ready:
+                result.append(copy)
+                pending.remove(copy)
+            continue
+        dst, _ = pending[0]
+        result.append((temp, dst))
+        pending = [(d, temp if s == dst else s) for d, s in pending]
+    return result
+
+
+def lower(function: Function) -> list[Instruction]:
+    """Translate SSA back to the VM's instruction format.
+
+    Phis become copies at the end of their predecessors, blocks are laid out
+    in reverse postorder so loop bodies and then-branches fall through, and
+    branches become SKP over the false side where possible.
+    """
+    _split_critical_edges(function)
+    order = reverse_postorder(function)
+
+    taken = set()
+    for op in _all_ops(function):
+        if op.kind in ("load", "assign", "idx", "store") or op.kind == "phi":
+            taken.add(op.array)
+    for value in _input_values(function):
+        taken.add(value.name)
+
+    # Loads of an array variable that is never reassigned can read it by name.
+    assigned = {op.array for op in _all_ops(function) if op.kind == "assign"}
+    names = {
+        op.result: op.array
+        for op in _all_ops(function)
+        if op.kind == "load" and op.array not in assigned
+    }
+    counter = 0
+
+    def fresh(prefix):
+        nonlocal counter
+        while True:
+            name = f"{prefix}{counter}"
+            counter += 1
+            if name not in taken:
+                return name
+
+    def operand(value) -> str:
+        if isinstance(value, int):
+            return str(value)
+        if value.op is None:
+            return value.name
+        if value not in names:
+            variable = value.op.kind == "phi" and value.op.array != FLAG
+            names[value] = fresh(f"{value.op.array}_" if variable else "t")
+        return names[value]
+
+    code = {}
+    for block in order:
+        out = []
+        for op in block.ops:
+            if op.kind == "aop":
+                out.append(Instruction(OpCode.AOP, op.operator, *map(operand, op.args), operand(op.result)))
+            elif op.kind == "com":
+                out.append(Instruction(OpCode.COM, op.operator, *map(operand, op.args), operand(op.result)))
+            elif op.kind == "idx":
+                out.append(Instruction(OpCode.IDX, op.array, operand(op.args[0]), operand(op.result)))
+            elif op.kind == "store":
+                index, value = op.args
+                out.append(Instruction(OpCode.ASN, f"{op.array}[{operand(index)}]", operand(value)))
+            elif op.kind == "load" and names.get(op.result) != op.array:
+                out.append(Instruction(OpCode.ASN, operand(op.result), op.array))
+            elif op.kind == "assign":
+                out.append(Instruction(OpCode.ASN, op.array, operand(op.args[0])))
+            elif op.kind == "call":
+                out.append(Instruction(OpCode.CAL, op.operator, *map(operand, op.args), operand(op.result)))
+
+        term = block.term
+        if isinstance(term, Jump):
+            copies = [(operand(phi.result), operand(phi.incoming[block])) for phi in term.target.phis]
+            for dst, src in _sequentialize(copies, fresh("t")):
+                out.append(Instruction(OpCode.ASN, dst, src))
+        elif isinstance(term, Branch):
+            last = block.ops[-1] if block.ops else None
+            if not (last is not None and last.kind == "com" and last.result is term.cond):
+                out.append(Instruction(OpCode.COM, "!=", operand(term.cond), "0", fresh("t")))
+        code[block] = out
+
+    position = {block: i for i, block in enumerate(order)}
+
+    def terminator(block):
+        """Terminator instructions; jump targets are block objects until resolved"""
+        term = block.term
+        nxt = order[position[block] + 1] if position[block] + 1 < len(order) else None
+        if isinstance(term, Return):
+            return [(OpCode.RET, term.value)]
+        if isinstance(term, Jump):
+            return [] if term.target is nxt else [(OpCode.JMP, term.target)]
+        if term.true_block is nxt and position[term.false_block] > position[block]:
+            return [(OpCode.SKP, term.false_block)]
+        if term.false_block is nxt:
+            return [(OpCode.SKP, 1), (OpCode.JMP, term.true_block)]
+        return [(OpCode.SKP, 1), (OpCode.JMP, term.true_block), (OpCode.JMP, term.false_block)]
+
+    starts = {}
+    pc = 0
+    for block in order:
+        starts[block] = pc
+        pc += len(code[block]) + len(terminator(block))
+
+    instructions = []
+    for block in order:
+        instructions.extend(code[block])
+        for opcode, arg in terminator(block):
+            if opcode == OpCode.RET:
+                instructions.append(
+                    Instruction(OpCode.RET) if arg is None else Instruction(OpCode.RET, operand(arg))
+                )
+            elif opcode == OpCode.JMP:
+                instructions.append(Instruction(OpCode.JMP, starts[arg]))
+            elif isinstance(arg, BasicBlock):
+                instructions.append(Instruction(OpCode.SKP, starts[arg] - len(instructions) - 1))
+            else:
+                instructions.append(Instruction(OpCode.SKP, arg))
+    return instructions
+
+
+def _input_values(function):
+    for op in _all_ops(function):
+        for value in op.operands():
+            if isinstance(value, Value) and value.op is None:
+                yield value
+    for block in function.blocks:
+        term = block.term
+        for value in (getattr(term, "cond", None), getattr(term, "value", None)):
+            if isinstance(value, Value) and value.op is None:
+                yield value
+
+
+def compile_ast(ast: Block, optimize_ir=True) -> list[Instruction]:
+    """Compile an AST to instructions through the SSA IR"""
+    function = build(ast)
+    if optimize_ir:
+        optimize(function)
+    else:
+        remove_unreachable(function)
+        remove_trivial_phis(function)
+    return lower(function)
@@ -0,0 +1,337 @@
+import sys
+
+from decoder import ARITHMETIC, COMPARISONS
+from intrinsics import namespace as intrinsics
+from opcodes import OpCode, parse_operand, split_target, reads, writes
+from vm import UNLIMITED
+
+LOOP_THRESHOLD = 100
+EXIT_THRESHOLD = 100
+MAX_TRACE = 1000
+MAX_ENTRY_MISSES = 16
+BLOCKED = -sys.maxsize
+
+
+class _Guard:
+    """A recorded SKP: which way it went, where the other way leads, and its trace if any"""
+
+    def __init__(self, pc, skipped, exit_pc, index):
+        self.pc = pc
+        self.skipped = skipped
+        self.exit_pc = exit_pc
+        self.index = index
+        self.alt = None
+
+
+class _Loop:
+    """A traced loop: the recorded path from head back to head and its compiled function"""
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+        self.path = None
+        self.guards = []
+        self.exits = []
+        self.misses = 0
+        self.function = None
+        self.metered = None
+
+
+class Tracer:
+    """Tracing JIT over a VM's decoded instructions.
+
+    Back-edge JMPs of innermost loops count how often they jump to their loop
+    head. Once a loop passes the threshold, the next iteration is recorded
+    instruction by instruction, including which way every SKP went, and
+    compiled into a Python function that runs whole iterations on local
+    variables. The loop head then enters that function, which guards the
+    types of the registers it reads on entry and takes a side exit back to
+    the interpreter, at the pc the interpreter would have reached and with
+    all written registers stored back, whenever execution leaves the
+    recorded path. Side exits that become hot get their own path recorded
+    and compiled into the same function. While the VM runs on a limited
+    fuel (a run_for slice or a checkpoint interval), loops enter a metered
+    variant of the function instead, which charges every iteration's
+    instructions to the fuel and returns to the loop head once it is used up.
+    """
+
+    def __init__(self, vm, ops, threshold=LOOP_THRESHOLD):
+        self.vm = vm
+        self.ops = ops
+        self.original = list(ops)
+        self.instructions = vm.instructions
+        self.threshold = threshold
+        self.loops = {}
+        self.recording = None
+
+        back_edges = {}
+        for tail, instr in enumerate(self.instructions):
+            if instr.opcode != OpCode.JMP:
+                continue
+            head = int(instr.operands[0])
+            if head <= tail:
+                back_edges.setdefault(head, []).append(tail)
+        for head, tails in back_edges.items():
+            if self._innermost(head, max(tails)):
+                self._count(head, tails)
+
+    def _innermost(self, head, tail) -> bool:
+        """Check that no back-edge of another loop lies inside [head, tail)"""
+        for pc in range(head, tail):
+            instr = self.instructions[pc]
+            if instr.opcode == OpCode.JMP and head < int(instr.operands[0]) <= pc:
+                return False
+        return True
+
+    def _count(self, head, tails):
+        """Make a loop's back-edge JMPs start recording once the loop is hot.
+
+        A loop can have several back-edges when jump threading sends the end
+        of an if branch straight to the head; they share one count.
+        """
+        count = 0
+        jumps = {tail: self.original[tail] for tail in tails}
+
+        def counter(jump):
+            def op():
+                nonlocal count
+                count += 1
+                if count >= self.threshold and self.recording is None:
+                    for tail, original in jumps.items():
+                        self.ops[tail] = original
+                    self._record(_Loop(head, max(tails)), None)
+                return jump()
+
+            return op
+
+        for tail, jump in jumps.items():
+            self.ops[tail] = counter(jump)
+
+    def _record(self, loop, guard):
+        """Record the path from the next executed pc to the loop's back-edge"""
+        self.recording = (loop, guard, [])
+        for pc in range(loop.head, loop.tail + 1):
+            self.ops[pc] = self._recorder(pc)
+
+    def _recorder(self, pc):
+        original = self.original[pc]
+
+        def op():
+            nxt = original()
+            self._step(pc, nxt)
+            return nxt
+
+        return op
+
+    def _step(self, pc, nxt):
+        loop, guard, path = self.recording
+        instr = self.instructions[pc]
+
+        if instr.opcode == OpCode.SKP:
+            skipped = nxt != pc + 1
+            other = pc + 1 if skipped else pc + 1 + int(instr.operands[0])
+            path.append(_Guard(pc, skipped, other, len(loop.guards)))
+            loop.guards.append(path[-1])
+            loop.exits.append(0)
+        elif instr.opcode == OpCode.JMP:
+            if int(instr.operands[0]) == loop.head:
+                self._finish(loop, guard, path)
+                return
+            path.append(pc)
+        elif instr.opcode == OpCode.RET:
+            self._abort(loop, guard)
+            return
+        else:
+            path.append(pc)
+
+        if not loop.head <= nxt <= loop.tail or len(path) > MAX_TRACE:
+            self._abort(loop, guard)
+
+    def _restore(self, loop):
+        """Put the decoded instructions of a loop back, entering its trace if compiled"""
+        self.recording = None
+        for pc in range(loop.head, loop.tail + 1):
+            self.ops[pc] = self.original[pc]
+        if loop.function is not None:
+            self.ops[loop.head] = self._entry(loop)
+
+    def _finish(self, loop, guard, path):
+        if guard is None:
+            loop.path = path
+            self.loops[loop.head] = loop
+        else:
+            guard.alt = path
+        loop.function = self._compile(loop)
+        loop.metered = None
+        self._restore(loop)
+
+    def _abort(self, loop, guard):
+        if guard is not None:
+            loop.exits[guard.index] = BLOCKED
+        self._restore(loop)
+
+    def _entry(self, loop):
+        """Loop head that runs the compiled trace, falling back to the interpreter"""
+        head_op = self.original[loop.head]
+        vm = self.vm
+
+        def op():
+            if vm.fuel < UNLIMITED:
+                if loop.metered is None:
+                    loop.metered = self._compile(loop, metered=True)
+                nxt, exit_index = loop.metered()
+            else:
+                nxt, exit_index = loop.function()
+            if nxt is None:
+                loop.misses += 1
+                if loop.misses > MAX_ENTRY_MISSES:
+                    self.ops[loop.head] = head_op
+                return head_op()
+
+            if exit_index is not None and loop.exits[exit_index] >= EXIT_THRESHOLD:
+                if self.recording is None and loop.head <= nxt <= loop.tail:
+                    self._record(loop, loop.guards[exit_index])
+                else:
+                    loop.exits[exit_index] = BLOCKED
+            return nxt
+
+        return op
+
+    def _live_ins(self, path, written, live):
+        """Registers a path reads before writing them"""
+        for step in path:
+            if isinstance(step, _Guard):
+                if step.alt is not None:
+                    self._live_ins(step.alt, set(written), live)
+                continue
+            instr = self.instructions[step]
+            indexed = instr.opcode == OpCode.ASN and "[" in str(instr.operands[0])
+            names = reads(instr) + ([split_target(instr.operands[0])[0]] if indexed else [])
+            live.update(name for name in names if name not in written)
+            if not indexed and writes(instr) is not None:
+                written.add(writes(instr))
+
+    def _written(self, path, names):
+        for step in path:
+            if isinstance(step, _Guard):
+                if step.alt is not None:
+                    self._written(step.alt, names)
+            else:
+                written = writes(self.instructions[step])
+                if written is not None:
+                    names.add(written)
+
+    def _compile(self, loop, metered=False):
+        """Generate and compile the Python function for a loop's trace tree"""
+        live = set()
+        self._live_ins(loop.path, set(), live)
+        written = set()
+        self._written(loop.path, written)
+
+        namespace = {"v": self.vm.variables, "vm": self.vm, "exits": loop.exits, **intrinsics()}
+        guards = []
+        for name in sorted(live):
+            kind = type(self.vm.variables.get(name, 0))
+            type_name = f"T{len(namespace)}"
+            namespace[type_name] = kind
+            guards.append(f"type(r_{name}) is not {type_name}")
+
+        sync = [f"v[{name!r}] = r_{name}" for name in sorted(written)] + [
+            "vm.last_cmp = cmp"
+        ]
+        if metered:
+            sync.append("vm.fuel = fuel")
+
+        def charge(spent) -> list[str]:
+            return [f"fuel -= {spent}"] if metered and spent else []
+
+        lines = ["def trace():"]
+        lines += [f"    r_{name} = v.get({name!r}, 0)" for name in sorted(live | written)]
+        if guards:
+            lines.append(f"    if {' or '.join(guards)}:")
+            lines.append("        return None, None")
+        lines.append("    cmp = vm.last_cmp")
+        if metered:
+            lines.append("    fuel = vm.fuel")
+        lines.append("    try:")
+        lines.append("        while fuel > 0:" if metered else "        while True:")
+        self._emit_path(loop.path, 3, sync, charge, lines)
+        lines.append("    except BaseException:")
+        lines += [f"        {line}" for line in sync]
+        lines.append("        raise")
+        if metered:
+            lines += [f"    {line}" for line in sync]
+            lines.append(f"    return {loop.head}, None")
+
+        exec(compile("\n".join(lines), f"<trace {loop.head}-{loop.tail}>", "exec"), namespace)
+        return namespace["trace"]
+
+    def _emit_path(self, path, depth, sync, charge, lines, spent=0):
+        """Emit a path; spent counts the instructions run since the loop head"""
+        pad = "    " * depth
+        for step in path:
+            if isinstance(step, _Guard):
+                spent += 1
+                lines.append(f"{pad}if {'cmp' if step.skipped else 'not cmp'}:")
+                if step.alt is not None:
+                    self._emit_path(step.alt, depth + 1, sync, charge, lines, spent)
+                else:
+                    lines += [f"{pad}    {line}" for line in charge(spent)]
+                    lines += [f"{pad}    {line}" for line in sync]
+                    lines.append(f"{pad}    exits[{step.index}] += 1")
+                    lines.append(f"{pad}    return {step.exit_pc}, {step.index}")
+            else:
+                lines += [f"{pad}{line}" for line in self._statement(step, charge(spent) + sync)]
+                spent += 1
+        lines += [f"{pad}{line}" for line in charge(spent + 1)]
+        lines.append(f"{pad}continue")
+
+    def _statement(self, pc, sync) -> list[str]:
+        """Python statements for one traced instruction on local registers"""
+        instr = self.instructions[pc]
+        opcode = instr.opcode
+        operands = instr.operands
+
+        def value(operand) -> str:
+            operand = parse_operand(operand)
+            return repr(operand) if isinstance(operand, int) else f"r_{operand}"
+
+        if opcode == OpCode.ASN:
+            name, index = split_target(operands[0])
+            if index is None:
+                return [f"r_{name} = {value(operands[1])}"]
+            # Stores that would grow the array leave the trace and let the
+            # interpreter re-execute them.
+            return [
+                f"if {value(index)} < len(r_{name}):",
+                f"    r_{name}[{value(index)}] = {value(operands[1])}",
+                "else:",
+                *[f"    {line}" for line in sync],
+                f"    return {pc}, None",
+            ]
+
+        elif opcode == OpCode.AOP:
+            op, left, right, result = operands
+            if op == "=":
+                return [f"r_{result} = {value(right)}"]
+            if op not in ARITHMETIC:
+                return []
+            return [f"r_{result} = {value(left)} {ARITHMETIC[op]} {value(right)}"]
+
+        elif opcode == OpCode.COM:
+            op, left, right, result = operands
+            if op in COMPARISONS:
+                expr = f"{value(left)} {COMPARISONS[op]} {value(right)}"
+            else:
+                expr = "False"
+            return [f"r_{result} = cmp = {expr}"]
+
+        elif opcode == OpCode.IDX:
+            array, index, result = str(operands[0]), value(operands[1]), operands[2]
+            return [f"r_{result} = r_{array}[{index}] if {index} < len(r_{array}) else 0"]
+
+        elif opcode == OpCode.CAL:
+            name, *args, result = operands
+            return [f"r_{result} = intrinsic_{name}({', '.join(value(arg) for arg in args)})"]
+
+        return []
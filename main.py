@@ -1,9 +1,13 @@
-from sys import argv
+import sys
 
-from parser import Parser
-from tokenizer import tokenize, validate_syntax
-from generator import Generator
-from vm import VM
+COMMANDS = ("compile", "run", "bench", "disasm", "sweep", "fuzz", "cost")
+COMPILED_SUFFIX = ".psub"
+OPT_LEVEL = dict(
+    type=int,
+    choices=(0, 1, 2),
+    default=0,
+    help="0: direct generator, 1: through the SSA IR, 2: with IR optimizations",
+)
 
 
 def get_code(filename):
@@ -12,43 +16,268 @@ def get_code(filename):
     return contents
 
 
-tokens = tokenize(get_code(argv[1]))
-if not validate_syntax(tokens)[0]:
-    raise SyntaxError(validate_syntax(tokens)[1])
+def parse_source(source):
+    """Tokenize and parse pseudo code source into an AST"""
+    from parser import Parser
+    from tokenizer import tokenize, validate_syntax
+
+    tokens = tokenize(source)
+    valid, message = validate_syntax(tokens)
+    if not valid:
+        raise SyntaxError(message)
 
-try:
     parser = Parser(tokens)
-    ast = parser.parse()
+    return parser.parse()
+
+
+def compile_tree(ast, opt_level=0):
+    """Generate instructions for a parsed program.
+
+    Level 0 uses the direct AST generator, level 1 goes through the SSA IR
+    and level 2 also runs the IR optimizations. Levels 1 and up finish with
+    jump threading and block layout.
+    """
+    if opt_level == 0:
+        from generator import Generator
+
+        return Generator().generate(ast)
+
+    from ir import compile_ast
+    from optimizer import optimize
+
+    return optimize(compile_ast(ast, optimize_ir=opt_level >= 2))
+
+
+def compile_source(source, opt_level=0):
+    """Generate instructions for pseudo code source"""
+    return compile_tree(parse_source(source), opt_level)
+
+
+def load_program(filename, opt_level=0):
+    """Load instructions from a compiled program or compile a source file.
+
+    Compiled programs only import the bytecode reader, never the front end.
+    """
+    if filename.endswith(COMPILED_SUFFIX):
+        from bytecode import load
+
+        return load(filename)
+    return compile_source(get_code(filename), opt_level)
+
 
-    generator = Generator()
-    instructions = generator.generate(ast)
-    lines = [
+def listing(instructions):
+    return [
         f"{i:{len(str(len(instructions)))+1}d}: {instr}"
         for i, instr in enumerate(instructions)
     ]
 
-    vm = VM(instructions)
-    print("=" * 60)
+
+def parse_value(text):
+    if text.startswith("["):
+        return eval(text)
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def read_inputs(vm, assignments):
+    """Take inputs from NAME=VALUE arguments, prompting for any that are missing"""
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        vm.inputs[name] = parse_value(value)
 
     print("Required inputs:", list(vm.inputs.keys()))
     for var in vm.inputs.keys():
-        user_input = input(f"{var} = ")
-
-        if user_input.startswith("["):
-            vm.inputs[var] = eval(user_input)
-        else:
-            try:
-                vm.inputs[var] = int(user_input)
-            except ValueError:
-                vm.inputs[var] = user_input
-    print("=" * 60)
-    result = vm.run(**vm.inputs)
+        if vm.inputs[var] is None:
+            vm.inputs[var] = parse_value(input(f"{var} = "))
+
+
+def cmd_compile(args):
+    from bytecode import dump
 
-    print("\n".join(lines))
+    instructions = compile_source(get_code(args.source), args.opt_level)
+    output = args.output or args.source.rsplit(".", 1)[0] + COMPILED_SUFFIX
+    dump(instructions, output)
+    print(f"Wrote {len(instructions)} instructions to {output}")
 
+
+def cmd_run(args):
+    from vm import VM
+
+    if args.parallel:
+        from parallel import ParallelVM, compile_parallel
+
+        if args.program.endswith(COMPILED_SUFFIX):
+            raise SystemExit("--parallel needs the source file, not compiled bytecode")
+        instructions, loops = compile_parallel(parse_source(get_code(args.program)))
+        vm = ParallelVM(
+            instructions,
+            loops,
+            workers=args.workers,
+            serial=args.serial,
+            verify=args.verify,
+            jit=args.jit,
+        )
+    else:
+        instructions = load_program(args.program, args.opt_level)
+        vm = VM(instructions, verify=args.verify, jit=args.jit)
+    print("=" * 60)
+    read_inputs(vm, args.inputs)
     print("=" * 60)
+    try:
+        result = vm.run(**vm.inputs)
+    finally:
+        if args.parallel:
+            vm.close()
+
+    if args.listing:
+        print("\n".join(listing(instructions)))
+        print("=" * 60)
     print(f"Return value: {result}")
     print("=" * 60)
 
-except SyntaxError as e:
-    print(f"Parse error: {e}")
+
+def cmd_disasm(args):
+    if args.ir:
+        from ir import build, optimize
+
+        function = build(parse_source(get_code(args.program)))
+        print(optimize(function) if args.opt_level >= 2 else function)
+        return
+    print("\n".join(listing(load_program(args.program, args.opt_level))))
+
+
+def cmd_bench(args):
+    import bench
+
+    bench.main(repeat=args.repeat, size=args.size)
+
+
+def cmd_sweep(args):
+    from bench import make_inputs, parameters
+    from metering import report, sweep
+
+    source = get_code(args.program)
+    names = parameters(source)
+    instructions = compile_source(source, args.opt_level)
+    results = sweep(
+        instructions, lambda n: make_inputs(names, n), args.sizes, verify=args.verify
+    )
+    print("\n".join(report(results)))
+
+
+def cmd_cost(args):
+    from cost import estimate, recommend_engine
+
+    result = estimate(parse_source(get_code(args.program)))
+    print(result)
+    if args.inputs:
+        inputs = {}
+        for assignment in args.inputs:
+            name, _, value = assignment.partition("=")
+            inputs[name] = parse_value(value)
+        predicted = result.predict(inputs)
+        print(f"predicted: {'unknown' if predicted is None else predicted} instructions")
+        print(f"engine: {recommend_engine(result, inputs)}")
+
+
+def cmd_fuzz(args):
+    from fuzz import ENGINES, OPTIONAL_ENGINES, fuzz
+
+    engines = {**ENGINES, **OPTIONAL_ENGINES} if args.parallel else ENGINES
+    failures = fuzz(args.iterations, args.seed, engines, shrink=not args.no_shrink, log=print)
+    print(f"{len(failures)} failing programs out of {args.iterations}")
+    if failures:
+        sys.exit(1)
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="Compile and run academic-style pseudo code"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compile_cmd = commands.add_parser("compile", help="compile a .psu file to bytecode")
+    compile_cmd.add_argument("source")
+    compile_cmd.add_argument("-o", "--output", help=f"output path (default: *{COMPILED_SUFFIX})")
+    compile_cmd.add_argument("-O", dest="opt_level", **OPT_LEVEL)
+    compile_cmd.set_defaults(func=cmd_compile)
+
+    run_cmd = commands.add_parser("run", help="run a .psu or compiled program")
+    run_cmd.add_argument("program")
+    run_cmd.add_argument("inputs", nargs="*", metavar="NAME=VALUE")
+    run_cmd.add_argument("--verify", action="store_true", help="verify and use the fast path")
+    run_cmd.add_argument("--jit", action="store_true", help="compile hot loops at runtime")
+    run_cmd.add_argument("--listing", action="store_true", help="print the instructions")
+    run_cmd.add_argument("-O", dest="opt_level", **OPT_LEVEL)
+    run_cmd.add_argument(
+        "--parallel", action="store_true", help="run independent for loops on a process pool"
+    )
+    run_cmd.add_argument("--workers", type=int, help="pool size for --parallel (default: cpu count)")
+    run_cmd.add_argument(
+        "--serial", action="store_true", help="with --parallel, keep every loop in this process"
+    )
+    run_cmd.set_defaults(func=cmd_run)
+
+    bench_cmd = commands.add_parser("bench", help="benchmark the demos and import time")
+    bench_cmd.add_argument("--repeat", type=int, default=5)
+    bench_cmd.add_argument("--size", type=int, default=200)
+    bench_cmd.set_defaults(func=cmd_bench)
+
+    sweep_cmd = commands.add_parser(
+        "sweep", help="count operations over growing inputs and fit growth curves"
+    )
+    sweep_cmd.add_argument("program")
+    sweep_cmd.add_argument(
+        "--sizes",
+        type=lambda text: [int(n) for n in text.split(",")],
+        default=[8, 16, 32, 64, 128, 256],
+        help="comma-separated input sizes",
+    )
+    sweep_cmd.add_argument("--verify", action="store_true", help="meter the fast path")
+    sweep_cmd.add_argument("-O", dest="opt_level", **OPT_LEVEL)
+    sweep_cmd.set_defaults(func=cmd_sweep)
+
+    cost_cmd = commands.add_parser(
+        "cost", help="estimate executed instructions as a polynomial in the inputs"
+    )
+    cost_cmd.add_argument("program")
+    cost_cmd.add_argument("inputs", nargs="*", metavar="NAME=VALUE")
+    cost_cmd.set_defaults(func=cmd_cost)
+
+    fuzz_cmd = commands.add_parser(
+        "fuzz", help="compare every engine and optimization level on random programs"
+    )
+    fuzz_cmd.add_argument("--iterations", type=int, default=200)
+    fuzz_cmd.add_argument("--seed", type=int, default=0)
+    fuzz_cmd.add_argument("--parallel", action="store_true", help="also run the process pool")
+    fuzz_cmd.add_argument("--no-shrink", action="store_true", help="report failures unminimized")
+    fuzz_cmd.set_defaults(func=cmd_fuzz)
+
+    disasm_cmd = commands.add_parser("disasm", help="print the instructions of a program")
+    disasm_cmd.add_argument("program")
+    disasm_cmd.add_argument("--ir", action="store_true", help="print the SSA control flow graph")
+    disasm_cmd.add_argument("-O", dest="opt_level", **OPT_LEVEL)
+    disasm_cmd.set_defaults(func=cmd_disasm)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        # `main.py file.psu` predates the subcommands and prints the listing.
+        argv = ["run", "--listing", *argv]
+
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except SyntaxError as e:
+        print(f"Parse error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import math
+from collections import Counter
+
+from decoder import bind
+from opcodes import OpCode, split_target
+from vm import VM
+
+SIZES = (8, 16, 32, 64, 128, 256)
+MODELS = {
+    "1": lambda n: 1,
+    "log n": lambda n: math.log2(n),
+    "n": lambda n: n,
+    "n log n": lambda n: n * math.log2(n),
+    "n^2": lambda n: n**2,
+    "n^3": lambda n: n**3,
+}
+
+
+class Meter:
+    """Operation counts of one run.
+
+    ``opcodes`` counts executed instructions by opcode name, ``comparisons``
+    COM instructions by operator, ``reads`` and ``writes`` IDX and indexed ASN
+    instructions by array name, and ``calls`` CAL instructions by intrinsic.
+    """
+
+    def __init__(self):
+        self.instructions = 0
+        self.opcodes = Counter()
+        self.comparisons = Counter()
+        self.reads = Counter()
+        self.writes = Counter()
+        self.calls = Counter()
+
+    @classmethod
+    def from_counts(cls, instructions, counts):
+        """Aggregate per-pc execution counts into per-operation counters"""
+        meter = cls()
+        for instr, count in zip(instructions, counts):
+            if not count:
+                continue
+            meter.instructions += count
+            meter.opcodes[instr.opcode.name] += count
+            operands = instr.operands
+            if instr.opcode == OpCode.COM:
+                meter.comparisons[operands[0]] += count
+            elif instr.opcode == OpCode.IDX:
+                meter.reads[str(operands[0])] += count
+            elif instr.opcode == OpCode.ASN and "[" in str(operands[0]):
+                meter.writes[split_target(operands[0])[0]] += count
+            elif instr.opcode == OpCode.CAL:
+                meter.calls[str(operands[0])] += count
+        return meter
+
+    def as_dict(self) -> dict[str, int]:
+        """Flat metric name -> count, with totals for comparisons, reads and writes"""
+        metrics = {
+            "instructions": self.instructions,
+            "assignments": self.opcodes["ASN"],
+            "comparisons": sum(self.comparisons.values()),
+            "reads": sum(self.reads.values()),
+            "writes": sum(self.writes.values()),
+        }
+        for prefix, counter in (
+            ("opcode", self.opcodes),
+            ("compare", self.comparisons),
+            ("read", self.reads),
+            ("write", self.writes),
+            ("call", self.calls),
+        ):
+            for name, count in sorted(counter.items()):
+                metrics[f"{prefix} {name}"] = count
+        return metrics
+
+
+class MeteredVM(VM):
+    """VM that counts every executed instruction.
+
+    Runs on a separately decoded variant of the program in which each
+    instruction also bumps its pc's counter, so the plain VM and its
+    decodings pay nothing for metering. Per-operation counts are derived from
+    the per-pc counts after the run. Tracing would skip the counters, so a
+    MeteredVM never uses the JIT.
+    """
+
+    def __init__(self, program, verify=False):
+        super().__init__(program, verify=verify)
+        self.counts = [0] * len(self.instructions)
+
+    def start(self, **initial_vars):
+        self.counts[:] = [0] * len(self.counts)
+        super().start(**initial_vars)
+
+    def meter(self) -> Meter:
+        """Counts of the current or last run"""
+        return Meter.from_counts(self.instructions, self.counts)
+
+    def _select_ops(self):
+        fast = self.verification is not None and self.verification.preconditions_hold(
+            self.variables
+        )
+        if fast not in self._bound:
+            code = self.program.decoded(fast, metered=True)
+            self._bound[fast] = bind(code, self, counts=self.counts)
+        return self._bound[fast]
+
+
+def fit(sizes, values):
+    """Least-squares fits of values ~ a * f(n) + b for every growth model, best first.
+
+    Returns (model, a, b, r2) tuples ordered by residual, simpler models
+    first among equally good fits.
+    """
+    mean = sum(values) / len(values)
+    total = sum((y - mean) ** 2 for y in values)
+    fits = []
+    for rank, (name, f) in enumerate(MODELS.items()):
+        xs = [f(n) for n in sizes]
+        x_mean = sum(xs) / len(xs)
+        spread = sum((x - x_mean) ** 2 for x in xs)
+        a = sum((x - x_mean) * (y - mean) for x, y in zip(xs, values)) / spread if spread else 0.0
+        b = mean - a * x_mean
+        residual = sum((y - (a * x + b)) ** 2 for x, y in zip(xs, values))
+        r2 = 1 - residual / total if total else 1.0
+        fits.append((round(residual / total, 9) if total else 0, rank, (name, a, b, r2)))
+    fits.sort(key=lambda fit: fit[:2])
+    return [result for _, _, result in fits]
+
+
+def sweep(program, make_inputs, sizes=SIZES, verify=False) -> list[tuple[int, Meter]]:
+    """Run a program once per input size and meter each run.
+
+    make_inputs(n) returns the keyword inputs for size n.
+    """
+    vm = MeteredVM(program, verify=verify)
+    results = []
+    for n in sizes:
+        vm.run(**make_inputs(n))
+        results.append((n, vm.meter()))
+    return results
+
+
+def report(results) -> list[str]:
+    """Table of every metric's counts across sizes with its best growth model"""
+    sizes = [n for n, _ in results]
+    rows = [meter.as_dict() for _, meter in results]
+    names = [name for name in rows[-1] if rows[-1][name]]
+
+    width = max(len(name) for name in names + ["metric"]) + 2
+    header = f"{'metric':<{width}}" + "".join(f"{n:>10}" for n in sizes) + "  growth"
+    lines = [header]
+    for name in names:
+        values = [row.get(name, 0) for row in rows]
+        model, a, b, r2 = fit(sizes, values)[0]
+        counts = "".join(f"{value:>10}" for value in values)
+        growth = f"{b:.3g}" if model == "1" else f"{a:.3g} {model}"
+        lines.append(f"{name:<{width}}{counts}  ~{growth} (r2={r2:.4f})")
+    return lines
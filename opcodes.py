@@ -25,3 +25,73 @@ class Instruction:
     def __repr__(self):
         operands_str = " ".join(str(op) for op in self.operands)
         return f"{self.opcode.name} {operands_str}".strip()
+
+
+def parse_operand(operand) -> int | str:
+    """Decode an operand the way VM.get_value does: an integer literal or a variable name"""
+    operand = str(operand)
+    try:
+        return int(operand)
+    except ValueError:
+        return operand
+
+
+def split_target(target) -> tuple[str, int | str | None]:
+    """Split an ASN target into (name, index); index is None for plain variables"""
+    target = str(target)
+    if "[" not in target:
+        return target, None
+    name, index = target.split("[", 1)
+    return name, parse_operand(index.rstrip("]"))
+
+
+def reads(instr: Instruction) -> list[str]:
+    """Variable names an instruction reads"""
+    opcode = instr.opcode
+    operands = instr.operands
+
+    if opcode == OpCode.ASN:
+        names = [operands[1]]
+        index = split_target(operands[0])[1]
+        if index is not None:
+            names.append(index)
+    elif opcode in (OpCode.AOP, OpCode.COM):
+        names = [operands[1], operands[2]]
+    elif opcode == OpCode.IDX:
+        names = [operands[0], operands[1]]
+    elif opcode == OpCode.CAL:
+        names = list(operands[1:-1])
+    elif opcode == OpCode.RET:
+        names = list(operands)
+    else:
+        names = []
+    return [name for name in map(parse_operand, names) if isinstance(name, str)]
+
+
+def writes(instr: Instruction) -> str | None:
+    """Variable name an instruction writes; indexed stores write their array"""
+    opcode = instr.opcode
+    operands = instr.operands
+
+    if opcode == OpCode.ASN:
+        return split_target(operands[0])[0]
+    elif opcode in (OpCode.AOP, OpCode.COM):
+        return str(operands[3])
+    elif opcode == OpCode.IDX:
+        return str(operands[2])
+    elif opcode == OpCode.CAL:
+        return str(operands[-1])
+    return None
+
+
+def successors(pc: int, instr: Instruction) -> list[int]:
+    """Indices that can execute after the instruction at pc"""
+    opcode = instr.opcode
+
+    if opcode == OpCode.JMP:
+        return [int(instr.operands[0])]
+    elif opcode == OpCode.SKP:
+        return [pc + 1, pc + 1 + int(instr.operands[0])]
+    elif opcode == OpCode.RET:
+        return []
+    return [pc + 1]
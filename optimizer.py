@@ -0,0 +1,198 @@
+from opcodes import Instruction, OpCode
+
+CONTROL = (OpCode.JMP, OpCode.SKP, OpCode.RET)
+
+
+class Block:
+    """A run of straight-line instructions and how control leaves it.
+
+    ``kind`` is "ret", "jmp", "skp" or "fall". ``targets`` holds the jump or
+    fall-through target for "jmp" and "fall", and for "skp" the block run
+    when the last comparison was true followed by the one skipped to when it
+    was false. A target of None is the end of the program.
+    """
+
+    def __init__(self, index, body, kind, terminator=None):
+        self.index = index
+        self.body = body
+        self.kind = kind
+        self.terminator = terminator
+        self.targets = []
+
+    def __repr__(self):
+        return f"Block({self.index}, {self.kind})"
+
+
+def split_blocks(instructions) -> list[Block] | None:
+    """Basic blocks in program order, or None if a jump leaves the program"""
+    size = len(instructions)
+    leaders = {0}
+    for pc, instr in enumerate(instructions):
+        if instr.opcode not in CONTROL:
+            continue
+        leaders.add(pc + 1)
+        try:
+            if instr.opcode == OpCode.JMP:
+                target = int(instr.operands[0])
+            elif instr.opcode == OpCode.SKP:
+                target = pc + 1 + int(instr.operands[0])
+            else:
+                continue
+        except (IndexError, ValueError):
+            return None
+        if not 0 <= target <= size:
+            return None
+        leaders.add(target)
+
+    starts = sorted(pc for pc in leaders if pc < size)
+    blocks, at = [], {}
+    for index, (start, end) in enumerate(zip(starts, starts[1:] + [size])):
+        last = instructions[end - 1]
+        if last.opcode in CONTROL:
+            kind = last.opcode.name.lower()
+            block = Block(index, list(instructions[start : end - 1]), kind, last)
+        else:
+            block = Block(index, list(instructions[start:end]), "fall")
+        at[start] = block
+        blocks.append(block)
+
+    for block, start, end in zip(blocks, starts, starts[1:] + [size]):
+        if block.kind == "jmp":
+            block.targets = [at.get(int(block.terminator.operands[0]))]
+        elif block.kind == "skp":
+            block.targets = [at.get(end), at.get(end + int(block.terminator.operands[0]))]
+        elif block.kind == "fall":
+            block.targets = [at.get(end)]
+    return blocks
+
+
+def _forward(block):
+    """Follow blocks that do nothing but pass control on"""
+    seen = set()
+    while (
+        block is not None
+        and not block.body
+        and block.kind in ("jmp", "fall")
+        and block not in seen
+    ):
+        seen.add(block)
+        block = block.targets[0]
+    return block
+
+
+def _later(target, block) -> bool:
+    return target is None or target.index > block.index
+
+
+def thread_jumps(blocks):
+    """Retarget jumps that land on other jumps at the end of the chain.
+
+    JMP and fall-through edges can go anywhere. A SKP can only skip forward,
+    so its false edge is threaded only when the end of the chain lies after
+    it, and its true edge always falls through into the next block.
+    """
+    for block in blocks:
+        if block.kind in ("jmp", "fall"):
+            block.targets[0] = _forward(block.targets[0])
+        elif block.kind == "skp":
+            target = _forward(block.targets[1])
+            if _later(target, block):
+                block.targets[1] = target
+
+
+def reachable(blocks) -> list[Block]:
+    """Blocks reachable from the entry, in program order"""
+    seen = set()
+    stack = blocks[:1]
+    while stack:
+        block = stack.pop()
+        if block is None or block in seen:
+            continue
+        seen.add(block)
+        stack.extend(block.targets)
+    return [block for block in blocks if block in seen]
+
+
+def sink_returns(order) -> list[Block]:
+    """Move regions that can only end the run out of the way of their neighbours.
+
+    When a block jumps forward over a region whose every path ends in a RET
+    (typically the else branch of an if whose then branch jumps to the join),
+    moving the region to the end of the program lets the jump fall through.
+    The region runs at most once per run, so it is the cold path.
+    """
+    order = list(order)
+    for _ in range(len(order)):
+        place = {block: k for k, block in enumerate(order)}
+        for i, block in enumerate(order):
+            target = block.targets[0] if block.kind == "jmp" else None
+            j = place.get(target)
+            if j is None or j <= i + 1:
+                continue
+            region = order[i + 1 : j]
+            members = set(region)
+            if all(t is None or t in members for b in region for t in b.targets):
+                order = order[: i + 1] + order[j:] + region
+                break
+        else:
+            break
+    return order
+
+
+def emit(order) -> list[Instruction]:
+    """Lay out blocks in order, adding only the jumps that cannot fall through"""
+    place = {block: k for k, block in enumerate(order)}
+    code = []
+    starts = {}
+    for k, block in enumerate(order):
+        following = order[k + 1] if k + 1 < len(order) else None
+        starts[block] = len(code)
+        code.extend(block.body)
+
+        if block.kind == "ret":
+            code.append(block.terminator)
+        elif block.kind in ("jmp", "fall"):
+            if block.targets[0] is not following:
+                code.append(("jmp", block.targets[0]))
+        else:
+            true, false = block.targets
+            if true is following and (false is None or place[false] > k):
+                code.append(("skp", false))
+            elif false is following:
+                code += [("skp1",), ("jmp", true)]
+            else:
+                code += [("skp1",), ("jmp", true), ("jmp", false)]
+
+    size = len(code)
+
+    def start(block):
+        return size if block is None else starts[block]
+
+    result = []
+    for pc, item in enumerate(code):
+        if isinstance(item, Instruction):
+            result.append(item)
+        elif item[0] == "jmp":
+            result.append(Instruction(OpCode.JMP, start(item[1])))
+        elif item[0] == "skp":
+            result.append(Instruction(OpCode.SKP, start(item[1]) - pc - 1))
+        else:
+            result.append(Instruction(OpCode.SKP, 1))
+    return result
+
+
+def optimize(instructions) -> list[Instruction]:
+    """Thread jump chains, drop unreachable code and re-lay out the blocks.
+
+    Control flow only moves between blocks and SKPs keep the comparisons they
+    read, so the result runs exactly like the input, minus the extra
+    dispatches. Only code where jumps chain or returns sit in the way changes;
+    plain loops and ifs come out as they went in. Programs with jumps out of
+    range are returned unchanged.
+    """
+    blocks = split_blocks(instructions)
+    if not blocks:
+        return list(instructions)
+    thread_jumps(blocks)
+    order = sink_returns(reachable(blocks))
+    return emit(order)
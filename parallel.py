@@ -0,0 +1,541 @@
+import array
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from generator import Generator
+from parser import (
+    Literal,
+    Identifier,
+    ArrayAccess,
+    BinaryOp,
+    Assignment,
+    IfStatement,
+    WhileLoop,
+    ForLoop,
+    Block,
+)
+from shared import Attachment, SharedArray, SharedProgram, attach_program
+from vm import UNLIMITED, VM
+
+PARALLEL_THRESHOLD = 200_000
+IDENTITY = {"+": 0, "*": 1}
+MIN_PATTERN = {("E", "<"), ("E", "<="), ("s", ">"), ("s", ">=")}
+
+
+class NotParallel(Exception):
+    """Raised by the dependence analysis when a loop cannot run in parallel"""
+
+
+class LoopPlan:
+    """What a parallel for loop reads, writes and reduces"""
+
+    def __init__(self, loop, var, arrays_read, arrays_written, privates, reductions, shared):
+        self.loop = loop
+        self.var = var
+        self.arrays_read = arrays_read
+        self.arrays_written = arrays_written
+        self.privates = privates
+        self.reductions = reductions
+        self.shared = shared
+
+
+def _same(a, b) -> bool:
+    """Structural equality of two AST nodes"""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, (Literal, Identifier)):
+        return vars(a) == vars(b)
+    if isinstance(a, ArrayAccess):
+        return _same(a.array, b.array) and _same(a.index, b.index)
+    if isinstance(a, BinaryOp):
+        return a.operator == b.operator and _same(a.left, b.left) and _same(a.right, b.right)
+    return False
+
+
+def _is_name(node, name) -> bool:
+    return isinstance(node, Identifier) and node.name == name
+
+
+def _scalar_name(node):
+    """Name read by an Identifier or a non-numeric Literal, else None"""
+    if isinstance(node, Identifier):
+        return node.name
+    if isinstance(node, Literal):
+        try:
+            int(node.value)
+        except ValueError:
+            return str(node.value)
+    return None
+
+
+class _Dependences:
+    """Walks a for loop body collecting what each iteration reads and writes.
+
+    Tracks the scalars definitely assigned at every point so a scalar read
+    before the iteration assigns it (a loop-carried value) can be told apart
+    from a per-iteration private one.
+    """
+
+    def __init__(self, var):
+        self.var = var
+        self.scalar_reads = set()
+        self.scalar_writes = set()
+        self.read_before_write = set()
+        self.array_reads = {}
+        self.array_writes = set()
+        self.reductions = {}
+
+    def reduce(self, name, op):
+        if self.reductions.setdefault(name, op) != op:
+            raise NotParallel(f"{name} is reduced with both {self.reductions[name]} and {op}")
+
+    def expression(self, node, defined):
+        name = _scalar_name(node)
+        if name is not None:
+            if name != self.var:
+                self.scalar_reads.add(name)
+                if name not in defined:
+                    self.read_before_write.add(name)
+        elif isinstance(node, ArrayAccess):
+            if not isinstance(node.array, Identifier):
+                raise NotParallel("array expression")
+            self.array_reads.setdefault(node.array.name, []).append(node.index)
+            self.expression(node.index, defined)
+        elif isinstance(node, BinaryOp):
+            self.expression(node.left, defined)
+            self.expression(node.right, defined)
+        elif not isinstance(node, Literal):
+            raise NotParallel(f"unsupported expression {node}")
+
+    def block(self, node, defined) -> set:
+        for stmt in node.statements:
+            defined = self.statement(stmt, defined)
+        return defined
+
+    def statement(self, node, defined) -> set:
+        if isinstance(node, Block):
+            return self.block(node, defined)
+
+        if isinstance(node, Assignment):
+            return self.assignment(node, defined)
+
+        if isinstance(node, IfStatement):
+            if self.min_max(node, defined):
+                return defined
+            self.expression(node.condition, defined)
+            then_defined = self.block(node.then_block, defined)
+            else_defined = self.block(node.else_block, defined) if node.else_block else defined
+            return then_defined & else_defined
+
+        if isinstance(node, WhileLoop):
+            self.expression(node.condition, defined)
+            self.block(node.body, defined)
+            return defined
+
+        if isinstance(node, ForLoop):
+            defined = self.assignment(node.assignment, defined)
+            self.expression(node.end, defined)
+            inner = node.assignment.target.name
+            self.block(node.body, defined)
+            self.expression(Identifier(inner), defined)
+            return defined
+
+        if isinstance(node, (Literal, Identifier, ArrayAccess, BinaryOp)):
+            self.expression(node, defined)
+            return defined
+
+        raise NotParallel(f"unsupported statement {type(node).__name__}")
+
+    def assignment(self, node, defined) -> set:
+        target = node.target
+        if isinstance(target, ArrayAccess):
+            if not isinstance(target.array, Identifier) or not _is_name(target.index, self.var):
+                raise NotParallel("array store not indexed by the loop variable")
+            self.expression(node.value, defined)
+            self.array_writes.add(target.array.name)
+            return defined
+
+        if not isinstance(target, Identifier):
+            raise NotParallel("invalid assignment target")
+        name = target.name
+        if name == self.var:
+            raise NotParallel("loop variable assigned in body")
+
+        value = node.value
+        if isinstance(value, BinaryOp) and value.operator in IDENTITY:
+            for own, other in ((value.left, value.right), (value.right, value.left)):
+                if _is_name(own, name) and not self._reads(other, name):
+                    self.reduce(name, value.operator)
+                    self.expression(other, defined)
+                    return defined
+
+        self.expression(value, defined)
+        self.scalar_writes.add(name)
+        return defined | {name}
+
+    def min_max(self, node, defined) -> bool:
+        """Recognize `if E < s then s <- E end` (and its mirrors) as a min or max reduction"""
+        cond = node.condition
+        statements = node.then_block.statements
+        if (
+            node.else_block
+            or not isinstance(cond, BinaryOp)
+            or cond.operator not in ("<", "<=", ">", ">=")
+            or len(statements) != 1
+            or not isinstance(statements[0], Assignment)
+            or not isinstance(statements[0].target, Identifier)
+        ):
+            return False
+
+        name = statements[0].target.name
+        value = statements[0].value
+        if _is_name(cond.right, name) and _same(cond.left, value):
+            side = "E"
+        elif _is_name(cond.left, name) and _same(cond.right, value):
+            side = "s"
+        else:
+            return False
+        if name == self.var or self._reads(value, name):
+            return False
+
+        self.reduce(name, "min" if (side, cond.operator) in MIN_PATTERN else "max")
+        self.expression(value, defined)
+        return True
+
+    def _reads(self, node, name) -> bool:
+        if _scalar_name(node) == name:
+            return True
+        if isinstance(node, ArrayAccess):
+            return self._reads(node.array, name) or self._reads(node.index, name)
+        if isinstance(node, BinaryOp):
+            return self._reads(node.left, name) or self._reads(node.right, name)
+        return False
+
+
+def analyze(loop: ForLoop) -> LoopPlan:
+    """Prove the iterations of a for loop independent, raising NotParallel if they may not be.
+
+    Iterations are independent when every array they write is only accessed
+    at the loop variable's index, every scalar they write is assigned before
+    it is read in the same iteration, and every other scalar they update is a
+    `+`, `*`, min or max reduction that nothing else in the body reads.
+    """
+    if not isinstance(loop.assignment.target, Identifier):
+        raise NotParallel("invalid loop variable")
+    var = loop.assignment.target.name
+
+    deps = _Dependences(var)
+    deps.block(loop.body, set())
+
+    reductions = deps.reductions
+    arrays = set(deps.array_reads) | deps.array_writes
+    scalars = deps.scalar_reads | deps.scalar_writes
+    if arrays & (scalars | set(reductions)):
+        raise NotParallel("name used as both array and scalar")
+    for name in reductions:
+        if name in scalars:
+            raise NotParallel(f"reduction variable {name} is also read or assigned")
+    carried = deps.scalar_writes & deps.read_before_write
+    if carried:
+        raise NotParallel(f"loop-carried scalars {sorted(carried)}")
+    for name in deps.array_writes:
+        if not all(_is_name(index, var) for index in deps.array_reads.get(name, [])):
+            raise NotParallel(f"{name} is written at i and read elsewhere")
+    if not deps.array_writes and not reductions:
+        raise NotParallel("loop has no array writes or reductions")
+
+    end = _Dependences(var)
+    end.expression(loop.end, set())
+    if (
+        _reads_name(loop.end, var)
+        or end.scalar_reads & (deps.scalar_writes | set(reductions))
+        or set(end.array_reads) & deps.array_writes
+    ):
+        raise NotParallel("loop bound changes inside the loop")
+
+    return LoopPlan(
+        loop,
+        var,
+        sorted(arrays),
+        sorted(deps.array_writes),
+        sorted(deps.scalar_writes),
+        reductions,
+        sorted(deps.scalar_reads - deps.scalar_writes),
+    )
+
+
+def _reads_name(node, name) -> bool:
+    return _Dependences(None)._reads(node, name)
+
+
+def evaluate(node, variables):
+    """Evaluate an expression with the VM's semantics"""
+    name = _scalar_name(node)
+    if name is not None:
+        return variables.get(name, 0)
+    if isinstance(node, Literal):
+        return int(node.value)
+    if isinstance(node, ArrayAccess):
+        values = variables.get(node.array.name, [])
+        index = evaluate(node.index, variables)
+        return values[index] if index < len(values) else 0
+    left = evaluate(node.left, variables)
+    right = evaluate(node.right, variables)
+    return {
+        "+": lambda: left + right,
+        "-": lambda: left - right,
+        "*": lambda: left * right,
+        "/": lambda: left // right,
+        "<": lambda: left < right,
+        ">": lambda: left > right,
+        "<=": lambda: left <= right,
+        ">=": lambda: left >= right,
+        "=": lambda: left == right,
+        "!=": lambda: left != right,
+    }.get(node.operator, lambda: False)()
+
+
+class ParallelLoop:
+    """A for loop proven parallel: its plan and pc range"""
+
+    def __init__(self, plan, start, end):
+        self.plan = plan
+        self.start = start
+        self.end = end
+        names = {plan.var, *plan.arrays_read, *plan.privates, *plan.reductions, *plan.shared}
+        self.bounds = tuple(_fresh(base, names) for base in ("lo", "hi"))
+
+    def chunk(self) -> list:
+        """Instructions running the iterations between the variables named by bounds"""
+        plan = self.plan
+        lo, hi = self.bounds
+        loop = ForLoop(Assignment(Identifier(plan.var), Identifier(lo)), Identifier(hi), plan.loop.body)
+        return Generator().generate(Block([loop]))
+
+
+def _fresh(name, taken) -> str:
+    while name in taken:
+        name += "_"
+    return name
+
+
+class ParallelGenerator(Generator):
+    """Generator that records the pc range of every for loop analyze() accepts"""
+
+    def __init__(self):
+        super().__init__()
+        self.loops = {}
+
+    def visit_for_loop(self, node):
+        start = self.position()
+        super().visit_for_loop(node)
+        try:
+            plan = analyze(node)
+        except NotParallel:
+            return
+        self.loops[start] = ParallelLoop(plan, start, self.position())
+
+
+def compile_parallel(ast):
+    """Generate instructions plus the parallel loops found in them, keyed by start pc"""
+    generator = ParallelGenerator()
+    instructions = generator.generate(ast)
+    return instructions, generator.loops
+
+
+_workers = {}
+
+
+def _run_chunk(program, scalars, arrays, readonly, results):
+    """Worker: run one chunk of a loop's iterations against shared arrays.
+
+    Each worker process decodes a loop's shared program once and keeps its
+    VM, so later chunks start with the decoded ops and JIT traces warm.
+    """
+    vm = _workers.get(program)
+    if vm is None:
+        vm = _workers[program] = VM(attach_program(program), jit=True)
+    with Attachment(arrays, readonly) as views:
+        try:
+            vm.run(**scalars, **views)
+            return {name: vm.variables.get(name) for name in results}
+        finally:
+            vm.variables.clear()
+
+
+class ParallelVM(VM):
+    """VM that runs independent for loops on a process pool.
+
+    When execution reaches a loop found by compile_parallel, its index range
+    is split into one contiguous chunk per worker. The loop's program is
+    published once in shared memory and every chunk runs it with its own
+    bounds. Arrays the loop touches are copied once into shared memory as
+    int64 and every worker maps them directly, read-only unless the loop
+    writes them, writing its own disjoint slots; scalars travel by value.
+    Reductions are combined in chunk order and private scalars take their
+    value from the last chunk that assigned them. Loops below the cost
+    threshold, loops whose stores could grow an array, loops where two names
+    refer to the same array (after `B <- A`), arrays that do not fit int64,
+    and any failure in a worker fall back to running the loop serially from
+    its start. With serial set no loop ever leaves the process. verify and
+    jit apply to everything that runs in this process, as for a plain VM.
+    """
+
+    def __init__(
+        self,
+        program,
+        loops,
+        workers=None,
+        threshold=PARALLEL_THRESHOLD,
+        serial=False,
+        verify=False,
+        jit=False,
+    ):
+        super().__init__(program, verify=verify, jit=jit)
+        self.loops = loops
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.serial = serial
+        self._pool = None
+        self._programs = {}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for program in self._programs.values():
+            program.close()
+        self._programs.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _loop(self):
+        if self.serial or not self.loops:
+            return super()._loop()
+
+        instructions = self.instructions
+        ops = self._ops
+        self.fuel = UNLIMITED
+        while self.pc < len(instructions):
+            loop = self.loops.get(self.pc)
+            if loop is not None and self._run_parallel(loop):
+                self.pc = loop.end
+            elif ops is not None:
+                self.pc = ops[self.pc]()
+            else:
+                pc_delta = self.execute(instructions[self.pc])
+                self.pc += 1 + pc_delta
+
+        return self.return_value
+
+    def _run_parallel(self, loop) -> bool:
+        """Run a loop on the pool, returning False if it should run serially instead"""
+        plan = loop.plan
+        variables = self.variables
+        try:
+            lo = evaluate(plan.loop.assignment.value, variables)
+            hi = evaluate(plan.loop.end, variables)
+        except Exception:
+            return False
+        if type(lo) is not int or type(hi) is not int:
+            return False
+
+        trips = hi - lo + 1
+        if trips < 2 or trips * (loop.end - loop.start) < self.threshold:
+            return False
+        for name in plan.arrays_written:
+            if lo < 0 or hi >= len(variables.get(name, ())):
+                return False
+        touched = [variables[name] for name in plan.arrays_read if name in variables]
+        if len({id(values) for values in touched}) < len(touched):
+            return False
+
+        buffers = {}
+        try:
+            for name in plan.arrays_read:
+                values = variables.get(name, [])
+                if not isinstance(values, (list, array.array)):
+                    return False
+                try:
+                    buffers[name] = SharedArray(values)
+                except (TypeError, OverflowError):
+                    return False
+
+            results = self._submit(loop, lo, hi, buffers)
+            if results is None:
+                return False
+
+            for name in plan.arrays_written:
+                values = buffers[name].tolist()
+                target = variables[name]
+                if isinstance(target, array.array):
+                    target[:] = array.array(target.typecode, values)
+                else:
+                    target[:] = values
+        finally:
+            for buffer in buffers.values():
+                buffer.close()
+
+        for name, op in plan.reductions.items():
+            total = variables.get(name, 0)
+            for result in results:
+                value = result[name]
+                if op == "+":
+                    total = total + value
+                elif op == "*":
+                    total = total * value
+                elif op == "min":
+                    total = min(total, value)
+                else:
+                    total = max(total, value)
+            variables[name] = total
+        for name in plan.privates:
+            for result in results:
+                if result[name] is not None:
+                    variables[name] = result[name]
+        variables[plan.var] = max(lo, hi + 1)
+        # The serial loop exits on a failed comparison, which SKPs after it test.
+        self.last_cmp = False
+        return True
+
+    def _submit(self, loop, lo, hi, buffers):
+        """Run the chunks of [lo, hi] on the pool; None if any of them failed"""
+        plan = loop.plan
+        variables = self.variables
+        scalars = {name: variables.get(name, 0) for name in plan.shared}
+        scalars.update(dict.fromkeys(plan.privates))
+        for name, op in plan.reductions.items():
+            scalars[name] = IDENTITY.get(op, variables.get(name, 0))
+        arrays = {name: buffer.handle for name, buffer in buffers.items()}
+        readonly = sorted(set(plan.arrays_read) - set(plan.arrays_written))
+        results = list(plan.privates) + list(plan.reductions)
+
+        if loop.start not in self._programs:
+            self._programs[loop.start] = SharedProgram(loop.chunk())
+        program = self._programs[loop.start].handle
+        lo_name, hi_name = loop.bounds
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        count = min(self.workers, hi - lo + 1)
+        size, extra = divmod(hi - lo + 1, count)
+        futures = []
+        start = lo
+        for chunk in range(count):
+            end = start + size + (chunk < extra) - 1
+            bounds = {lo_name: start, hi_name: end}
+            futures.append(
+                self._pool.submit(
+                    _run_chunk, program, {**scalars, **bounds}, arrays, readonly, results
+                )
+            )
+            start = end + 1
+
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            return None
@@ -57,6 +57,15 @@ class UnaryOp(ASTNode):
         return f"UnaryOp({self.operator}, {self.operand})"
 
 
+class Call(ASTNode):
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __repr__(self):
+        return f"Call({self.name}, {self.args})"
+
+
 class Assignment(ASTNode):
     def __init__(self, target, value):
         self.target = target
@@ -339,11 +348,26 @@ class Parser:
                 index = self.parse_expression()
                 self.consume("]")
                 expr = ArrayAccess(expr, index)
+            elif token[0] == "(" and isinstance(expr, Identifier):
+                expr = Call(expr.name, self.parse_arguments())
             else:
                 break
 
         return expr
 
+    def parse_arguments(self) -> list[ASTNode]:
+        self.consume("(")
+        args = []
+
+        if self.current_token() and self.current_token()[0] != ")":
+            args.append(self.parse_expression())
+            while self.current_token() and self.current_token()[0] == ",":
+                self.consume(",")
+                args.append(self.parse_expression())
+
+        self.consume(")")
+        return args
+
     def parse_primary(self) -> ASTNode:
         token = self.current_token()
         if token is None:
@@ -419,3 +443,45 @@ class Parser:
 
         self.consume("end")
         return FunctionStatement(name, params, Block(body))
+
+
+def unparse(node, indent=0) -> str:
+    """Source text that parses back to the same AST"""
+    pad = "    " * indent
+
+    if isinstance(node, Block):
+        return "\n".join(unparse(stmt, indent) for stmt in node.statements)
+    if isinstance(node, FunctionStatement):
+        params = ", ".join(param.name for param in node.param_ids)
+        return f"{pad}Algorithm {node.name.name}({params}) do\n{unparse(node.body, indent + 1)}\n{pad}end"
+    if isinstance(node, Assignment):
+        return f"{pad}{unparse(node.target)} <- {unparse(node.value)}"
+    if isinstance(node, IfStatement):
+        text = f"{pad}if {unparse(node.condition)} then\n{unparse(node.then_block, indent + 1)}"
+        if node.else_block and node.else_block.statements:
+            text += f"\n{pad}else\n{unparse(node.else_block, indent + 1)}"
+        return f"{text}\n{pad}end"
+    if isinstance(node, WhileLoop):
+        return f"{pad}while {unparse(node.condition)} do\n{unparse(node.body, indent + 1)}\n{pad}end"
+    if isinstance(node, ForLoop):
+        return (
+            f"{pad}for {unparse(node.assignment)} to {unparse(node.end)} do\n"
+            f"{unparse(node.body, indent + 1)}\n{pad}end"
+        )
+    if isinstance(node, ReturnStatement):
+        return f"{pad}return {unparse(node.value)}"
+    if isinstance(node, Literal):
+        return f"{pad}{node.value}"
+    if isinstance(node, Identifier):
+        return f"{pad}{node.name}"
+    if isinstance(node, ArrayAccess):
+        return f"{pad}{unparse(node.array)}[{unparse(node.index)}]"
+    if isinstance(node, BinaryOp):
+        return f"{pad}({unparse(node.left)} {node.operator} {unparse(node.right)})"
+    if isinstance(node, UnaryOp):
+        return f"{pad}({node.operator} {unparse(node.operand)})"
+    if isinstance(node, Call):
+        return f"{pad}{node.name}({', '.join(unparse(arg) for arg in node.args)})"
+    if isinstance(node, ArrayLiteral):
+        return f"{pad}[{', '.join(unparse(element) for element in node.elements)}]"
+    raise ValueError(f"Cannot unparse {type(node)}")
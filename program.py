@@ -0,0 +1,120 @@
+import re
+
+from opcodes import OpCode, split_target, reads, writes
+
+TEMP = re.compile(r"t\d+$")
+
+
+def detect_inputs(instructions) -> list[str]:
+    """Detect which variables are read before being written (i.e., inputs)"""
+    written = set()
+    inputs = {}
+
+    def read(operand):
+        op = str(operand)
+        if op.isalpha() and op not in written and not TEMP.match(op):
+            inputs[op] = None
+
+    for instr in instructions:
+        opcode = instr.opcode
+        operands = instr.operands
+
+        if opcode == OpCode.ASN:
+            read(operands[1])
+            target = str(operands[0])
+            if "[" not in target:
+                written.add(target)
+
+        elif opcode in (OpCode.AOP, OpCode.COM):
+            read(operands[1])
+            read(operands[2])
+            written.add(str(operands[3]))
+
+        elif opcode == OpCode.IDX:
+            read(operands[0])
+            read(operands[1])
+            written.add(str(operands[2]))
+
+        elif opcode == OpCode.CAL:
+            for operand in operands[1:-1]:
+                read(operand)
+            written.add(str(operands[-1]))
+
+    return list(inputs)
+
+
+class Program:
+    """A compiled program: instructions plus everything derived from them once.
+
+    A Program is never modified by running it, so one instance can back any
+    number of VMs. Derived data (input signature, register layout, the
+    verification and decoded instructions) is computed on construction or on
+    first use and then shared.
+    """
+
+    def __init__(self, instructions):
+        self.instructions = tuple(instructions)
+        self.inputs = tuple(detect_inputs(self.instructions))
+
+        names = set(self.inputs)
+        arrays = set()
+        for instr in self.instructions:
+            names.update(reads(instr))
+            written = writes(instr)
+            if written is not None:
+                names.add(written)
+            if instr.opcode == OpCode.IDX:
+                arrays.add(str(instr.operands[0]))
+            elif instr.opcode == OpCode.ASN and "[" in str(instr.operands[0]):
+                arrays.add(split_target(instr.operands[0])[0])
+
+        # Every variable gets a register that reads as 0 until written, which
+        # is exactly what the interpreter returns for a missing variable.
+        # Arrays get a fresh empty list per run instead.
+        self.arrays = tuple(sorted(arrays))
+        self.registers = dict.fromkeys(sorted(names - arrays), 0)
+        self.size = len(self.registers) + len(self.arrays)
+
+        self._hash = None
+        self._verification = None
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self.instructions)
+
+    @property
+    def hash(self) -> str:
+        """Hash of the instruction stream"""
+        if self._hash is None:
+            from snapshot import instructions_hash
+
+            self._hash = instructions_hash(self.instructions)
+        return self._hash
+
+    def verify(self):
+        """Verify the program once, raising VerificationError if it is malformed"""
+        if self._verification is None:
+            from verifier import VerificationError, verify
+
+            verification = verify(self.instructions, self.inputs)
+            if not verification.ok:
+                raise VerificationError("; ".join(verification.errors))
+            self._verification = verification
+        return self._verification
+
+    def decoded(self, fast: bool, metered=False):
+        """Decoded instructions of the verified program, guarded unless fast"""
+        key = (fast, metered)
+        if key not in self._decoded:
+            from decoder import decode
+
+            self._decoded[key] = decode(
+                self.instructions, self.verify() if fast else None, metered
+            )
+        return self._decoded[key]
+
+    def execution(self, verify=False, jit=False):
+        """Create a VM that runs this program"""
+        from vm import VM
+
+        return VM(self, verify=verify, jit=jit)
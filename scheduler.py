@@ -0,0 +1,103 @@
+import asyncio
+from collections import deque
+
+from vm import Status
+
+SLICE = 1000
+
+
+class BudgetExceeded(RuntimeError):
+    """A VM used up its instruction budget before finishing"""
+
+
+class Task:
+    """One VM run inside a Scheduler.
+
+    Awaiting a task gives the program's return value, or raises the error
+    the program raised, BudgetExceeded, or CancelledError.
+    """
+
+    def __init__(self, vm, budget, future):
+        self.vm = vm
+        self.budget = budget
+        self.used = 0
+        self.future = future
+
+    def cancel(self):
+        """Stop the run; the scheduler drops it before its next slice"""
+        self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class Scheduler:
+    """Round-robins many VMs on the asyncio event loop.
+
+    Every runnable task gets at most ``slice_size`` instructions per turn
+    through VM.run_for, then goes to the back of the queue, and the scheduler
+    yields to the event loop after each slice so other coroutines (and new
+    submissions) are served with bounded latency. No threads are involved;
+    a task only costs its VM's register file.
+    """
+
+    def __init__(self, slice_size=SLICE):
+        self.slice_size = slice_size
+        self.ready = deque()
+        self._wakeup = asyncio.Event()
+
+    def submit(self, vm, budget=None, **inputs) -> Task:
+        """Start a run of vm with inputs, limited to budget instructions if given"""
+        vm.start(**inputs)
+        task = Task(vm, budget, asyncio.get_running_loop().create_future())
+        self.ready.append(task)
+        self._wakeup.set()
+        return task
+
+    def __len__(self):
+        return len(self.ready)
+
+    async def run_until_idle(self):
+        """Run slices until no task is left"""
+        while self.ready:
+            self.step()
+            await asyncio.sleep(0)
+
+    async def serve(self):
+        """Run slices forever, sleeping while there is nothing to run"""
+        while True:
+            if not self.ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self.step()
+            await asyncio.sleep(0)
+
+    def step(self):
+        """Give the task at the front of the queue one slice"""
+        task = self.ready.popleft()
+        if task.future.done():
+            return
+
+        n = self.slice_size
+        if task.budget is not None:
+            n = min(n, task.budget - task.used)
+            if n <= 0:
+                task.future.set_exception(
+                    BudgetExceeded(f"budget of {task.budget} instructions used up")
+                )
+                return
+
+        try:
+            status = task.vm.run_for(n)
+        except Exception as e:
+            task.future.set_exception(e)
+            return
+
+        if status is Status.DONE:
+            task.future.set_result(task.vm.return_value)
+        else:
+            task.used += n
+            self.ready.append(task)
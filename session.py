@@ -0,0 +1,405 @@
+from bisect import bisect_left, bisect_right
+from itertools import chain, repeat
+
+from opcodes import OpCode, Instruction
+from parser import (
+    Parser,
+    Block,
+    IfStatement,
+    WhileLoop,
+    ForLoop,
+    FunctionStatement,
+)
+from tokenizer import tokenize, validate_syntax
+from generator import Generator
+
+JUMPS = (OpCode.JMP, OpCode.SKP)
+MAX_PENDING_SHIFTS = 64
+
+
+def child_blocks(node) -> list[Block]:
+    """Blocks of statements nested directly inside a statement"""
+    if isinstance(node, IfStatement):
+        return [node.then_block] + ([node.else_block] if node.else_block else [])
+    elif isinstance(node, (WhileLoop, ForLoop, FunctionStatement)):
+        return [node.body]
+    return []
+
+
+class _Positions:
+    """[start, end) positions of statements, relocated lazily after edits.
+
+    An edit only logs how far everything after it moved; a position catches
+    up on the shifts logged since it was last read when it is read again, so
+    an edit costs the same however many statements follow it. The log is
+    folded into every position once it grows past MAX_PENDING_SHIFTS.
+    """
+
+    def __init__(self, positions=()):
+        self.log = []
+        self.items = {key: [start, end, 0] for key, (start, end) in dict(positions).items()}
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def __getitem__(self, key) -> tuple[int, int]:
+        item = self.items[key]
+        self._catch_up(item)
+        return item[0], item[1]
+
+    def _catch_up(self, item):
+        if item[2] < len(self.log):
+            for at, delta in self.log[item[2] :]:
+                if item[0] >= at:
+                    item[0] += delta
+                    item[1] += delta
+            item[2] = len(self.log)
+
+    def __setitem__(self, key, position):
+        self.items[key] = [*position, len(self.log)]
+
+    def update(self, positions):
+        for key, position in positions.items():
+            self[key] = position
+
+    def pop(self, key, default=None):
+        return self.items.pop(key, default)
+
+    def shift(self, at: int, delta: int, containing=()):
+        """Move positions starting at or after at by delta, and the end of those in containing"""
+        if not delta:
+            return
+        for key in containing:
+            if key in self.items:
+                start, end = self[key]
+                self.items[key] = [start, end + delta, len(self.log) + 1]
+        self.log.append((at, delta))
+        if len(self.log) > MAX_PENDING_SHIFTS:
+            for item in self.items.values():
+                self._catch_up(item)
+                item[2] = 0
+            self.log.clear()
+
+
+class _SpanParser(Parser):
+    """Parser that records the token span [start, end) of every statement"""
+
+    def __init__(self, tokens):
+        super().__init__(tokens)
+        self.spans = {}
+
+    def parse_statement(self):
+        start = self.pos
+        stmt = super().parse_statement()
+        if stmt is not None:
+            self.spans[id(stmt)] = (start, self.pos)
+        return stmt
+
+
+class _RangeGenerator(Generator):
+    """Generator that records the instruction range [start, end) of every statement emitting code"""
+
+    def __init__(self, statements):
+        super().__init__()
+        self.statements = statements
+        self.ranges = {}
+
+    def visit(self, node):
+        start = self.position()
+        result = super().visit(node)
+        if id(node) in self.statements and self.position() > start:
+            self.ranges[id(node)] = (start, self.position())
+        return result
+
+
+class CompilerSession:
+    """Keeps the tokens, AST and generated code of a source file so edits recompile incrementally.
+
+    After an edit only the changed lines are re-tokenized, only the shortest
+    run of sibling statements covering the edit is reparsed (widening to the
+    statements around it if that fails), and its regenerated instructions are
+    spliced into the program. Nothing after the splice is touched: token
+    spans and instruction ranges are relocated lazily (see _Positions), and
+    the jumps and skips around it catch up on the splices logged since the
+    program was last read when instructions is read again.
+    """
+
+    def __init__(self, source: str):
+        self.lines = source.split("\n")
+        self.line_tokens = [tokenize(line) for line in self.lines]
+        self.tokens = []
+        self.line_starts = [0]
+        for tokens in self.line_tokens:
+            self.tokens.extend(tokens)
+            self.line_starts.append(len(self.tokens))
+        self.valid = False
+        self.rebuild()
+
+    @property
+    def source(self) -> str:
+        return "\n".join(self.lines)
+
+    def rebuild(self):
+        """Parse and generate the whole program from the current tokens"""
+        self.valid = False
+        ok, message = validate_syntax(self.tokens)
+        if not ok:
+            raise SyntaxError(message)
+
+        parser = _SpanParser(self.tokens)
+        self.ast = parser.parse()
+        self.spans = _Positions(parser.spans)
+        self.parents = {}
+        self._index(self.ast, None)
+
+        self.generator = _RangeGenerator(self.spans)
+        self._instructions = self.generator.generate(self.ast)
+        self.ranges = _Positions(self.generator.ranges)
+        # Pcs of the jumps and skips whose operands are right, and (pc, applied)
+        # of those spliced in since, right once applied splices had happened.
+        self.jumps = [pc for pc, instr in enumerate(self._instructions) if instr.opcode in JUMPS]
+        self.new_jumps = []
+        self.splices = []
+        self.valid = True
+
+    @property
+    def instructions(self) -> list[Instruction]:
+        """The generated program, with jumps and skips relocated past every splice"""
+        if self.splices:
+            self._relocate()
+        return self._instructions
+
+    def edit(self, start_line: int, end_line: int, text: str):
+        """Replace lines [start_line, end_line) with text and recompile incrementally"""
+        new_lines = text.split("\n")
+        new_line_tokens = [tokenize(line) for line in new_lines]
+        new_tokens = [token for tokens in new_line_tokens for token in tokens]
+
+        token_start = self.line_starts[start_line]
+        token_end = self.line_starts[end_line]
+        token_delta = len(new_tokens) - (token_end - token_start)
+
+        self.lines[start_line:end_line] = new_lines
+        self.line_tokens[start_line:end_line] = new_line_tokens
+        self.tokens[token_start:token_end] = new_tokens
+        starts = [token_start]
+        for tokens in new_line_tokens:
+            starts.append(starts[-1] + len(tokens))
+        following = self.line_starts[end_line + 1 :]
+        if token_delta:
+            following = [start + token_delta for start in following]
+        self.line_starts[start_line:] = starts + following
+
+        if not self.valid:
+            self.rebuild()
+            return
+
+        region = self._region(token_start, token_end)
+        while region is not None:
+            if self._reparse(*region, token_delta):
+                return
+            region = self._widen(region)
+
+        self.rebuild()
+
+    def _index(self, block: Block, owner):
+        """Record the owning block and statement of every statement nested in block"""
+        for stmt in block.statements:
+            self.parents[id(stmt)] = (block, owner)
+            for child in child_blocks(stmt):
+                self._index(child, stmt)
+
+    def _forget(self, node):
+        """Drop bookkeeping for a statement and everything nested in it"""
+        self.spans.pop(id(node))
+        self.ranges.pop(id(node))
+        self.parents.pop(id(node), None)
+        for block in child_blocks(node):
+            for stmt in block.statements:
+                self._forget(stmt)
+
+    def _start(self, stmt) -> int:
+        return self.spans[id(stmt)][0]
+
+    def _end(self, stmt) -> int:
+        return self.spans[id(stmt)][1]
+
+    def _region(self, token_start: int, token_end: int):
+        """Innermost run of sibling statements covering the edited tokens, or None.
+
+        Returns (block, i, j, owner) for block.statements[i:j], where owner is
+        the statement the block belongs to. A pure insertion between two
+        statements gives an empty run.
+        """
+        found = None
+        block, owner = self.ast, None
+        while self._covers(block, token_start, token_end):
+            statements = block.statements
+            i = bisect_right(statements, token_start, key=self._end)
+            j = bisect_left(statements, token_end, key=self._start)
+            found = (block, i, j, owner)
+            if j - i != 1:
+                break
+            owner = statements[i]
+            block = next(
+                (
+                    child
+                    for child in child_blocks(owner)
+                    if self._covers(child, token_start, token_end)
+                ),
+                None,
+            )
+        return found
+
+    def _covers(self, block, token_start: int, token_end: int) -> bool:
+        """Check that the edited tokens lie between the first and last statement of block"""
+        return (
+            block is not None
+            and bool(block.statements)
+            and self._start(block.statements[0]) <= token_start
+            and token_end <= self._end(block.statements[-1])
+        )
+
+    def _widen(self, region):
+        """The run made of just the statement owning a region's block"""
+        owner = region[3]
+        if owner is None:
+            return None
+        block, parent = self.parents[id(owner)]
+        i = bisect_left(block.statements, self._start(owner), key=self._start)
+        return block, i, i + 1, parent
+
+    def _ancestors(self, owner) -> list[int]:
+        ancestors = []
+        while owner is not None:
+            ancestors.append(id(owner))
+            owner = self.parents[id(owner)][1]
+        return ancestors
+
+    def _reparse(self, block: Block, i: int, j: int, owner, token_delta: int) -> bool:
+        """Reparse and regenerate block.statements[i:j] in place; False if that is not enough"""
+        statements = block.statements
+        old = statements[i:j]
+        if old:
+            start, end = self._start(old[0]), self._end(old[-1])
+            if id(old[0]) not in self.ranges or id(old[-1]) not in self.ranges:
+                return False
+            code_start, code_end = self.ranges[id(old[0])][0], self.ranges[id(old[-1])][1]
+        else:
+            # A pure insertion; the code goes where the next statement starts
+            # (or at the end of the program), and jumps from before that
+            # point keep landing on it. At the end of a nested block that
+            # point is also the join of the enclosing statement, so widen.
+            if i < len(statements):
+                start = end = self._start(statements[i])
+                if id(statements[i]) not in self.ranges:
+                    return False
+                code_start = code_end = self.ranges[id(statements[i])][0]
+            elif owner is None:
+                start = end = self._end(statements[-1])
+                code_start = code_end = len(self._instructions)
+            else:
+                return False
+        new_end = end + token_delta
+        if not validate_syntax(self.tokens[start:new_end])[0]:
+            return False
+
+        parser = _SpanParser(self.tokens)
+        parser.pos = start
+        nodes = []
+        try:
+            while parser.pos < new_end:
+                node = parser.parse_statement()
+                if node is None:
+                    break
+                nodes.append(node)
+        except (SyntaxError, TypeError):
+            return False
+        if parser.pos != new_end or (not nodes and len(old) == len(statements)):
+            return False
+
+        ancestors = self._ancestors(owner)
+        for stmt in old:
+            self._forget(stmt)
+        self.spans.shift(end, token_delta, ancestors)
+        self.spans.update(parser.spans)
+
+        statements[i:j] = nodes
+        for node in nodes:
+            self.parents[id(node)] = (block, owner)
+            for child in child_blocks(node):
+                self._index(child, node)
+
+        self.generator.statements = self.spans
+        self.generator.ranges = {}
+        code = self.generator.generate_at(Block(nodes), code_start)
+        self._splice(code_start, code_end, code, ancestors)
+        self.ranges.update(self.generator.ranges)
+        return True
+
+    def _splice(self, start: int, end: int, code: list[Instruction], ancestors: list[int]):
+        """Replace instructions [start, end) with code, logging the splice for the jumps around it"""
+        delta = len(code) - (end - start)
+        self._instructions[start:end] = code
+        self.splices.append((start, end, delta))
+        applied = len(self.splices)
+        self.new_jumps += [(start + k, applied) for k, instr in enumerate(code) if instr.opcode in JUMPS]
+        if delta:
+            self.ranges.shift(end, delta, ancestors)
+
+    def _relocate(self):
+        """Replay the logged splices on every jump and skip that has not seen them.
+
+        Jumps inside a replaced range are dropped. Targets at or after the
+        end of a splice move with the code, except that when nothing was
+        replaced a forward jump to the insertion point lands on the new code.
+        Jumps that lie with their targets before every splice stay put, and
+        those past all of them just move by the total delta.
+        """
+        instructions = self._instructions
+        splices = self.splices
+        low = min(start for start, _, _ in splices)
+        high = total = 0
+        for start, end, delta in splices:
+            high = max(high, end - total + 1)
+            total += delta
+
+        jumps = []
+        for pc, applied in chain(zip(self.jumps, repeat(0)), self.new_jumps):
+            if applied == 0 and (pc < low or pc >= high):
+                new_pc = pc if pc < low else pc + total
+                instr = instructions[new_pc]
+                count = int(instr.operands[0])
+                target = count if instr.opcode == OpCode.JMP else pc + 1 + count
+                if pc < low and target < low:
+                    jumps.append(new_pc)
+                    continue
+                if pc >= high and target >= high:
+                    if instr.opcode == OpCode.JMP and total:
+                        instructions[new_pc] = Instruction(OpCode.JMP, target + total)
+                    jumps.append(new_pc)
+                    continue
+
+            new_pc = pc
+            for start, end, delta in splices[applied:]:
+                if new_pc >= end:
+                    new_pc += delta
+                elif new_pc >= start:
+                    break
+            else:
+                instr = instructions[new_pc]
+                count = int(instr.operands[0])
+                target = count if instr.opcode == OpCode.JMP else pc + 1 + count
+                backward = target <= pc
+                for start, end, delta in splices[applied:]:
+                    if target >= end and (target > start or backward):
+                        target += delta
+                if instr.opcode == OpCode.JMP:
+                    if target != count:
+                        instructions[new_pc] = Instruction(OpCode.JMP, target)
+                elif target - new_pc - 1 != count:
+                    instructions[new_pc] = Instruction(OpCode.SKP, target - new_pc - 1)
+                jumps.append(new_pc)
+        self.jumps = jumps
+        self.new_jumps = []
+        splices.clear()
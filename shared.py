@@ -0,0 +1,112 @@
+import array
+from multiprocessing.shared_memory import SharedMemory
+
+from bytecode import dumps, loads
+
+_programs = {}
+
+
+class SharedProgram:
+    """Instructions published in a named shared memory segment.
+
+    The segment holds the flat bytecode encoding, so a worker maps it and
+    decodes it once (see attach_program) instead of receiving pickled
+    instructions with every task.
+    """
+
+    def __init__(self, instructions):
+        data = dumps(instructions)
+        self.size = len(data)
+        self.segment = SharedMemory(create=True, size=max(self.size, 1))
+        self.segment.buf[: self.size] = data
+
+    @property
+    def handle(self) -> tuple[str, int]:
+        """What a worker needs to attach: (segment name, size)"""
+        return self.segment.name, self.size
+
+    def close(self):
+        self.segment.close()
+        self.segment.unlink()
+
+
+class SharedArray:
+    """A typed array published in a named shared memory segment.
+
+    Raises TypeError or OverflowError if the values do not fit the typecode
+    (int64 by default).
+    """
+
+    def __init__(self, values, typecode="q"):
+        data = array.array(typecode, values)
+        self.length = len(data)
+        self.typecode = typecode
+        self.segment = SharedMemory(create=True, size=max(len(data), 1) * data.itemsize)
+        self.segment.buf[: len(data) * data.itemsize] = memoryview(data).cast("B")
+
+    @property
+    def handle(self) -> tuple[str, int, str]:
+        """What a worker needs to attach: (segment name, length, typecode)"""
+        return self.segment.name, self.length, self.typecode
+
+    def tolist(self) -> list:
+        with self.segment.buf.cast(self.typecode) as view:
+            return view[: self.length].tolist()
+
+    def close(self):
+        self.segment.close()
+        self.segment.unlink()
+
+
+def attach_program(handle) -> list:
+    """Instructions of a shared program, decoded once per process"""
+    name, size = handle
+    if name not in _programs:
+        segment = SharedMemory(name=name, track=False)
+        try:
+            with segment.buf[:size] as data:
+                _programs[name] = loads(data)
+        finally:
+            segment.close()
+    return _programs[name]
+
+
+class Attachment:
+    """Zero-copy views of shared arrays in this process.
+
+    ``views`` maps each array name to a memoryview over its segment, read-only
+    for the names in readonly. Close the attachment once nothing uses the
+    views any more.
+    """
+
+    def __init__(self, handles, readonly=()):
+        self.segments = []
+        self.buffers = []
+        self.views = {}
+        try:
+            for name, (segment_name, length, typecode) in handles.items():
+                segment = SharedMemory(name=segment_name, track=False)
+                self.segments.append(segment)
+                self.buffers.append(segment.buf.cast(typecode))
+                self.buffers.append(self.buffers[-1][:length])
+                if name in readonly:
+                    self.buffers.append(self.buffers[-1].toreadonly())
+                self.views[name] = self.buffers[-1]
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self.views
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.views.clear()
+        for view in reversed(self.buffers):
+            view.release()
+        self.buffers.clear()
+        for segment in self.segments:
+            segment.close()
+        self.segments.clear()
@@ -0,0 +1,125 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"PSUSNAP1"
+HEADER = struct.Struct("<8sQ")
+ALIGN = 8
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+
+def instructions_hash(instructions) -> str:
+    """Hash an instruction stream so a snapshot only resumes the program it came from"""
+    digest = hashlib.sha256()
+    for instr in instructions:
+        digest.update(repr(instr).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _is_int64_array(value) -> bool:
+    """Check whether an array can be stored in the raw int64 layout"""
+    if isinstance(value, array.array):
+        return value.typecode == "q"
+    return isinstance(value, list) and all(
+        type(x) is int and INT64_MIN <= x <= INT64_MAX for x in value
+    )
+
+
+def save_snapshot(vm, path: str):
+    """Write pc, comparison flag, variables and program hash of a VM to path.
+
+    The file is a small JSON header followed by every integer array as raw
+    native int64 data, so it can be memory-mapped back in on resume. The file
+    is written to a temporary path and renamed, so a job killed mid-write
+    still leaves the previous checkpoint intact. Variables sharing one array
+    (after `B <- A`) are stored once and share it again on resume.
+    """
+    scalars = {}
+    arrays = {}
+    aliases = {}
+    owners = {}
+    blobs = []
+    offset = 0
+
+    for name, value in vm.variables.items():
+        if isinstance(value, (list, array.array)):
+            if id(value) in owners:
+                aliases[name] = owners[id(value)]
+                continue
+            owners[id(value)] = name
+        if _is_int64_array(value):
+            data = value if isinstance(value, array.array) else array.array("q", value)
+            arrays[name] = [offset, len(data)]
+            blobs.append(data)
+            offset += len(data) * data.itemsize
+        else:
+            scalars[name] = value
+
+    header = json.dumps(
+        {
+            "hash": vm.program.hash,
+            "byteorder": sys.byteorder,
+            "pc": vm.pc,
+            "last_cmp": vm.last_cmp,
+            "return_value": vm.return_value,
+            "variables": scalars,
+            "arrays": arrays,
+            "aliases": aliases,
+        }
+    ).encode()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (-(HEADER.size + len(header)) % ALIGN))
+        for data in blobs:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(vm, path: str):
+    """Restore VM state written by save_snapshot.
+
+    Integer arrays are decoded straight out of the mapped file in one pass
+    and handed back as plain lists, like every other VM array, so resumed
+    runs can grow them past int64 and still pass the verifier's preconditions.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, header_len = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"Not a VM snapshot: {path}")
+
+            header = json.loads(mm[HEADER.size : HEADER.size + header_len])
+            if header["hash"] != vm.program.hash:
+                raise ValueError("Snapshot was taken from a different program")
+
+            data_start = HEADER.size + header_len
+            data_start += -data_start % ALIGN
+
+            variables = dict(header["variables"])
+            with memoryview(mm) as view:
+                for name, (offset, length) in header["arrays"].items():
+                    start = data_start + offset
+                    data = array.array("q")
+                    data.frombytes(view[start : start + length * data.itemsize])
+                    if header["byteorder"] != sys.byteorder:
+                        data.byteswap()
+                    variables[name] = data.tolist()
+            for name, owner in header.get("aliases", {}).items():
+                variables[name] = variables[owner]
+
+    vm.pc = header["pc"]
+    vm.last_cmp = header["last_cmp"]
+    vm.return_value = header["return_value"]
+    vm.variables.clear()
+    vm.variables.update(variables)
@@ -0,0 +1,355 @@
+from intrinsics import INTRINSICS
+from opcodes import OpCode, parse_operand, split_target, reads, writes, successors
+
+ARITHMETIC = {"+", "-", "*", "/", "="}
+COMPARISONS = {"<", ">", "<=", ">=", "=", "!=", "and", "or"}
+ARITY = {
+    OpCode.ASN: (2,),
+    OpCode.AOP: (4,),
+    OpCode.COM: (4,),
+    OpCode.IDX: (3,),
+    OpCode.RET: (0, 1),
+    OpCode.SKP: (1,),
+    OpCode.JMP: (1,),
+}
+
+
+class VerificationError(ValueError):
+    pass
+
+
+class Verification:
+    """Facts proven about an instruction stream at load time.
+
+    ``defined[pc]`` holds the variables read at pc that are written on every
+    path reaching it (inputs count as written). ``in_bounds`` maps the pc of an
+    IDX or indexed ASN to the precondition that makes its index provably in
+    range. Preconditions are ``(array, bound, offset)`` triples meaning
+    ``len(array) >= bound + offset`` (``bound`` may be None, or
+    ``("length", name)`` for a variable holding ``length(name)``), and only
+    need to be checked once when a run starts because neither the array nor
+    the bound is ever reassigned.
+    """
+
+    def __init__(self, errors, defined, in_bounds, preconditions):
+        self.errors = errors
+        self.defined = defined
+        self.in_bounds = in_bounds
+        self.preconditions = preconditions
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def preconditions_hold(self, variables) -> bool:
+        """Check the array length preconditions against a run's initial variables"""
+        for array, bound, offset in self.preconditions:
+            arr = variables.get(array)
+            if isinstance(bound, tuple):
+                sized = variables.get(bound[1])
+                value = len(sized) if isinstance(sized, list) else None
+            else:
+                value = 0 if bound is None else variables.get(bound, 0)
+            if not isinstance(arr, list) or not isinstance(value, int):
+                return False
+            if len(arr) < value + offset:
+                return False
+        return True
+
+
+def _check_instruction(pc, instr, size) -> str | None:
+    """Return an error message if an instruction is malformed"""
+    opcode = instr.opcode
+    operands = instr.operands
+
+    if opcode == OpCode.CAL:
+        if len(operands) < 2:
+            return f"{pc}: CAL takes a name and a result, got {len(operands)} operands"
+        intrinsic = INTRINSICS.get(str(operands[0]))
+        if intrinsic is None:
+            return f"{pc}: unknown intrinsic {operands[0]!r}"
+        if intrinsic.arity is not None and len(operands) - 2 != intrinsic.arity:
+            return f"{pc}: {intrinsic.name} takes {intrinsic.arity} arguments, got {len(operands) - 2}"
+        return None
+
+    if opcode not in ARITY:
+        return f"{pc}: unsupported opcode {opcode.name}"
+    if len(operands) not in ARITY[opcode]:
+        return f"{pc}: {opcode.name} takes {ARITY[opcode]} operands, got {len(operands)}"
+
+    if opcode == OpCode.AOP and operands[0] not in ARITHMETIC:
+        return f"{pc}: unknown arithmetic operator {operands[0]!r}"
+    if opcode == OpCode.COM and operands[0] not in COMPARISONS:
+        return f"{pc}: unknown comparison operator {operands[0]!r}"
+
+    if opcode in (OpCode.JMP, OpCode.SKP):
+        if not isinstance(parse_operand(operands[0]), int):
+            return f"{pc}: {opcode.name} operand must be an integer"
+        for target in successors(pc, instr):
+            if not 0 <= target <= size:
+                return f"{pc}: {opcode.name} target {target} out of range"
+    return None
+
+
+def _defined_before_use(instructions, inputs):
+    """Must-defined dataflow: for each pc, the variables written on every path to it"""
+    size = len(instructions)
+    preds = [[] for _ in range(size + 1)]
+    for pc, instr in enumerate(instructions):
+        for succ in successors(pc, instr):
+            preds[succ].append(pc)
+
+    universe = set(inputs)
+    for instr in instructions:
+        written = writes(instr)
+        if written is not None:
+            universe.add(written)
+
+    entry = frozenset(inputs)
+    out = [None] * size
+    worklist = list(range(size - 1, -1, -1))
+    pending = set(worklist)
+    defined_in = [None] * size
+
+    while worklist:
+        pc = worklist.pop()
+        pending.discard(pc)
+
+        incoming = [out[p] for p in preds[pc] if out[p] is not None]
+        if pc == 0:
+            incoming.append(entry)
+        current = frozenset.intersection(*incoming) if incoming else frozenset(universe)
+        defined_in[pc] = current
+
+        written = writes(instructions[pc])
+        new_out = current | {written} if written is not None else current
+        if new_out != out[pc]:
+            out[pc] = new_out
+            for succ in successors(pc, instructions[pc]):
+                if succ < size and succ not in pending:
+                    pending.add(succ)
+                    worklist.append(succ)
+
+    return {
+        pc: {name for name in reads(instr) if name in defined_in[pc]}
+        for pc, instr in enumerate(instructions)
+    }
+
+
+def _loops(instructions, invariant, lengths):
+    """Find counted loops shaped like the generator's for loops.
+
+    Returns (var, low, bound, offset, body_start, body_end): inside
+    [body_start, body_end) ``low <= var <= bound + offset`` always holds.
+    Bounds are invariant variables or ``("length", array)`` for the variables
+    in lengths.
+    """
+    size = len(instructions)
+    sources = {}
+    for pc, instr in enumerate(instructions):
+        if instr.opcode in (OpCode.JMP, OpCode.SKP):
+            for target in successors(pc, instr)[-1:]:
+                sources.setdefault(target, []).append(pc)
+
+    def base(name):
+        if name in lengths:
+            return ("length", lengths[name])
+        return name if name in invariant else None
+
+    def symbolic(operand, start, end):
+        value = parse_operand(operand)
+        if isinstance(value, int):
+            return None, value
+        if base(value) is not None:
+            return base(value), 0
+        defs = [pc for pc in range(start, end) if writes(instructions[pc]) == value]
+        if len(defs) != 1 or instructions[defs[0]].opcode != OpCode.AOP:
+            return None
+        op, left, right, _ = instructions[defs[0]].operands
+        left, right = parse_operand(left), parse_operand(right)
+        if op in ("+", "-") and base(left) is not None and isinstance(right, int):
+            return base(left), right if op == "+" else -right
+        return None
+
+    loops = []
+    for jmp, instr in enumerate(instructions):
+        if instr.opcode != OpCode.JMP or jmp < 3:
+            continue
+        head = int(instr.operands[0])
+        if not 1 <= head < jmp:
+            continue
+
+        init = instructions[head - 1]
+        inc, store = instructions[jmp - 2], instructions[jmp - 1]
+        if init.opcode != OpCode.ASN or store.opcode != OpCode.ASN:
+            continue
+        var, low = str(init.operands[0]), parse_operand(init.operands[1])
+        if "[" in var or not isinstance(low, int):
+            continue
+        if inc.opcode != OpCode.AOP or inc.operands[:3] != ("+", var, "1"):
+            continue
+        if store.operands != (var, inc.operands[3]):
+            continue
+
+        com = next(
+            (pc for pc in range(head, jmp) if instructions[pc].opcode in (OpCode.SKP, OpCode.JMP, OpCode.RET)),
+            None,
+        )
+        if com is None or com == head or instructions[com].opcode != OpCode.SKP:
+            continue
+        skp, com = com, com - 1
+        cond = instructions[com]
+        if cond.opcode != OpCode.COM or cond.operands[:2] != ("<=", var):
+            continue
+        if skp + 1 + int(instructions[skp].operands[0]) != jmp + 1:
+            continue
+
+        entries_ok = sources.get(head, []) == [jmp] and all(
+            head <= src <= jmp
+            for target, srcs in sources.items()
+            if head < target <= jmp
+            for src in srcs
+        )
+        var_ok = all(
+            writes(instructions[pc]) != var for pc in range(head, jmp - 1)
+        )
+        end = symbolic(cond.operands[2], head, com)
+        if entries_ok and var_ok and end is not None:
+            loops.append((var, low, end[0], end[1], skp + 1, jmp - 2))
+
+    return loops
+
+
+def _copied(instructions) -> set[str]:
+    """Variables whose value may be copied into another register (aliasing an array).
+
+    A RET also hands its value out, but the run ends there.
+    """
+    copied = set()
+    for instr in instructions:
+        opcode, operands = instr.opcode, instr.operands
+        if opcode == OpCode.ASN:
+            values = operands[1:]
+        elif opcode == OpCode.AOP and operands[0] == "=":
+            values = operands[2:3]
+        elif opcode == OpCode.CAL and INTRINSICS[str(operands[0])].aliases:
+            values = operands[1:-1]
+        else:
+            continue
+        copied.update(name for name in map(parse_operand, values) if isinstance(name, str))
+    return copied
+
+
+def verify(instructions, inputs=()) -> Verification:
+    """Prove jump targets in range, variables defined before use and array accesses in bounds"""
+    size = len(instructions)
+    errors = [
+        error
+        for pc, instr in enumerate(instructions)
+        if (error := _check_instruction(pc, instr, size)) is not None
+    ]
+    if errors:
+        return Verification(errors, {}, {}, [])
+
+    defined = _defined_before_use(instructions, inputs)
+
+    writers = {}
+    for pc, instr in enumerate(instructions):
+        written = writes(instr)
+        if written is not None:
+            writers.setdefault(written, []).append(pc)
+    whole_assigned = {
+        name
+        for name, pcs in writers.items()
+        for pc in pcs
+        if instructions[pc].opcode != OpCode.ASN or "[" not in str(instructions[pc].operands[0])
+    }
+    invariant = {
+        name for instr in instructions for name in reads(instr) if name not in writers
+    }
+    copied = _copied(instructions)
+
+    # Variables assigned once from length(X) (directly or through one copy)
+    # can bound loops over any array at least as long as X, as long as X is
+    # never copied: a store through a copy could grow X unseen.
+    lengths = {}
+    for copies in (False, True):
+        for name, pcs in writers.items():
+            d = instructions[pcs[0]]
+            if len(pcs) != 1 or name in lengths:
+                continue
+            if not copies and d.opcode == OpCode.CAL and len(d.operands) == 3:
+                sized = str(d.operands[1])
+                intrinsic = INTRINSICS.get(str(d.operands[0]))
+                if intrinsic is not None and intrinsic.function is len and sized in inputs:
+                    if sized not in whole_assigned and sized not in copied:
+                        lengths[name] = sized
+            elif copies and d.opcode == OpCode.ASN and str(d.operands[1]) in lengths:
+                lengths[name] = lengths[str(d.operands[1])]
+    loops = _loops(instructions, invariant, lengths)
+
+    def index_range(pc, index):
+        """(low, bound, offset) such that low <= index <= bound + offset at pc"""
+        if isinstance(index, int):
+            return index, None, index
+        for var, low, bound, offset, body_start, body_end in loops:
+            if index == var and body_start <= pc < body_end:
+                return low, bound, offset
+        if index not in defined[pc] or len(writers.get(index, [])) != 1:
+            return None
+        definition = writers[index][0]
+        d = instructions[definition]
+        if d.opcode != OpCode.AOP or d.operands[0] not in ("+", "-"):
+            return None
+        left, right = parse_operand(d.operands[1]), parse_operand(d.operands[2])
+        if d.operands[0] == "+" and isinstance(left, int):
+            left, right = right, left
+        if not isinstance(right, int):
+            return None
+        shift = right if d.operands[0] == "+" else -right
+        for var, low, bound, offset, body_start, body_end in loops:
+            if left == var and body_start <= definition < body_end:
+                return low + shift, bound, offset + shift
+        return None
+
+    in_bounds = {}
+    stores = {}
+    for pc, instr in enumerate(instructions):
+        if instr.opcode == OpCode.IDX:
+            array, index = str(instr.operands[0]), parse_operand(instr.operands[1])
+        elif instr.opcode == OpCode.ASN and "[" in str(instr.operands[0]):
+            array, index = split_target(instr.operands[0])
+        else:
+            continue
+        if instr.opcode == OpCode.ASN:
+            stores[pc] = array
+        if array in whole_assigned or array not in inputs:
+            continue
+        found = index_range(pc, index)
+        if found is None or found[0] < 0:
+            continue
+        _, bound, offset = found
+        in_bounds[pc] = (array, bound, offset)
+
+    # A store that is not proven in bounds may grow its array, after which a
+    # length taken from it no longer matches the length checked at the start.
+    while True:
+        grown = {array for pc, array in stores.items() if pc not in in_bounds}
+        stale = [
+            pc
+            for pc, (_, bound, _) in in_bounds.items()
+            if isinstance(bound, tuple) and bound[1] in grown
+        ]
+        if not stale:
+            break
+        for pc in stale:
+            del in_bounds[pc]
+
+    needs = {}
+    for pc, (array, bound, offset) in in_bounds.items():
+        key = (array, bound)
+        needs[key] = max(needs.get(key, offset + 1), offset + 1)
+        in_bounds[pc] = key
+
+    preconditions = [(array, bound, offset) for (array, bound), offset in needs.items()]
+    return Verification(errors, defined, in_bounds, preconditions)
@@ -1,68 +1,46 @@
+import sys
+from enum import Enum
+
+from intrinsics import lookup
 from opcodes import OpCode
+from program import Program
 
+UNLIMITED = sys.maxsize
 
-class VM:
-    """Virtual Machine to execute generated opcodes"""
 
-    def __init__(self, instructions):
-        self.instructions = instructions
+class Status(Enum):
+    """Where a VM stands after running a slice"""
+
+    RUNNING = "running"
+    DONE = "done"
+
+
+class VM:
+    """Virtual Machine to execute generated opcodes.
+
+    A VM is the execution context of a Program: its register file, pc and
+    comparison flag. Every run starts from a freshly reset register file, so
+    one VM can run its program any number of times without rebuilding
+    anything and without state leaking from one run into the next.
+    """
+
+    def __init__(self, program, verify=False, jit=False):
+        if not isinstance(program, Program):
+            program = Program(program)
+        self.program = program
+        self.instructions = program.instructions
         self.pc = 0
         self.variables = {}
         self.last_cmp = False
         self.return_value = None
-        self.inputs = self._detect_inputs()
-
-    def _detect_inputs(self):
-        """Detect which variables are read before being written (i.e., inputs)"""
-        written = set()
-        inputs = {}
-
-        for instr in self.instructions:
-            opcode = instr.opcode
-            operands = instr.operands
-
-            if opcode == OpCode.ASN:
-
-                value = str(operands[1])
-                if (
-                    value.isalpha()
-                    and value not in written
-                    and not value.startswith("t")
-                ):
-                    inputs[value] = None
-
-                target = str(operands[0])
-                if "[" not in target:
-                    written.add(target.split("[")[0] if "[" in target else target)
-
-            elif opcode == OpCode.AOP:
-
-                for operand in [operands[1], operands[2]]:
-                    op = str(operand)
-                    if op.isalpha() and op not in written and not op.startswith("t"):
-                        inputs[op] = None
-
-                written.add(str(operands[3]))
-
-            elif opcode == OpCode.COM:
-
-                for operand in [operands[1], operands[2]]:
-                    op = str(operand)
-                    if op.isalpha() and op not in written and not op.startswith("t"):
-                        inputs[op] = None
-
-                written.add(str(operands[3]))
-
-            elif opcode == OpCode.IDX:
-
-                for operand in [operands[0], operands[1]]:
-                    op = str(operand)
-                    if op.isalpha() and op not in written and not op.startswith("t"):
-                        inputs[op] = None
-
-                written.add(str(operands[2]))
-
-        return inputs
+        self.checkpoint_path = None
+        self.checkpoint_every = 0
+        self.inputs = dict.fromkeys(program.inputs)
+        self.verification = program.verify() if verify else None
+        self.jit = jit
+        self.fuel = UNLIMITED
+        self._bound = {}
+        self._ops = None
 
     def get_value(self, operand):
         """Get value - either literal or variable"""
@@ -146,6 +124,12 @@ class VM:
             arr = self.variables.get(array_name, [])
             self.variables[result] = arr[index_val] if index_val < len(arr) else 0
 
+        elif opcode == OpCode.CAL:
+
+            name, *args, result = operands
+            function = lookup(name).function
+            self.variables[result] = function(*[self.get_value(arg) for arg in args])
+
         elif opcode == OpCode.SKP:
 
             n = int(operands[0])
@@ -167,15 +151,162 @@ class VM:
 
         return 0
 
-    def run(self, **initial_vars):
-        """Run program with initial variables"""
-        self.variables.update(initial_vars)
+    def checkpoint(self, path: str, every: int):
+        """Snapshot to path every `every` executed instructions during run/resume"""
+        self.checkpoint_path = path
+        self.checkpoint_every = every
+
+    def snapshot(self, path: str):
+        """Write the current execution state to path"""
+        from snapshot import save_snapshot
+
+        save_snapshot(self, path)
+
+    def resume(self, path: str):
+        """Restore execution state from a snapshot and run to completion"""
+        self.restore(path)
+        return self._loop()
+
+    def restore(self, path: str):
+        """Restore execution state from a snapshot; continue it with run_for"""
+        from snapshot import load_snapshot
+
+        load_snapshot(self, path)
+        self._ops = self._select_ops()
+
+    def reset(self, initial_vars):
+        """Reset the register file to the program's defaults, then apply initial_vars"""
+        variables = self.variables
+        if len(variables) != self.program.size:
+            variables.clear()
+        variables.update(self.program.registers)
+        for name in self.program.arrays:
+            if name not in initial_vars:
+                variables[name] = []
+        variables.update(initial_vars)
+
+    def start(self, **initial_vars):
+        """Prepare a run with initial variables without executing anything"""
+        self.reset(initial_vars)
         self.pc = 0
         self.last_cmp = False
         self.return_value = None
+        self._ops = self._select_ops()
+
+    def run(self, **initial_vars):
+        """Run program with initial variables"""
+        self.start(**initial_vars)
+        return self._loop()
+
+    def run_for(self, n: int) -> Status:
+        """Execute at most n instructions of the run prepared by start.
+
+        Returns DONE once the program has finished (its value is in
+        return_value) and RUNNING if it can be continued with another call.
+        With jit enabled compiled loops draw the instructions they run from
+        ``fuel`` and leave at their head once it is used up, so a slice can
+        overrun by at most one loop iteration.
+        """
+        size = len(self.instructions)
+        pc = self.pc
+        ops = self._ops
+        try:
+            if ops is not None and self.jit:
+                self.fuel = n
+                while self.fuel > 0 and pc < size:
+                    pc = ops[pc]()
+                    self.fuel -= 1
+            elif ops is not None:
+                while n and pc < size:
+                    pc = ops[pc]()
+                    n -= 1
+            else:
+                while n and pc < size:
+                    self.pc = pc
+                    pc += 1 + self.execute(self.instructions[pc])
+                    n -= 1
+        finally:
+            self.pc = pc
+        return Status.DONE if pc >= size else Status.RUNNING
+
+    def _select_ops(self):
+        """Pick decoded instructions for this run, or None to use execute.
+
+        Verified programs run on the unguarded decoding when the array length
+        preconditions hold, and on the guarded decoding otherwise. Every
+        register exists after reset, so reads never miss. With jit enabled
+        the decoded instructions also trace and compile hot loops.
+        """
+        if self.verification is None and not self.jit:
+            return None
+
+        fast = self.verification is not None and self.verification.preconditions_hold(
+            self.variables
+        )
+        if fast not in self._bound:
+            from decoder import bind
+
+            ops = bind(self.program.decoded(fast), self)
+            if self.jit:
+                from jit import Tracer
+
+                Tracer(self, ops)
+            self._bound[fast] = ops
+        return self._bound[fast]
+
+    def _loop(self):
+        """Execute from the current pc until the program ends"""
+        if self._ops is not None:
+            return self._loop_decoded()
+        if self.checkpoint_every:
+            return self._loop_checkpointed()
+
+        while self.pc < len(self.instructions):
+            pc_delta = self.execute(self.instructions[self.pc])
+            self.pc += 1 + pc_delta
+
+        return self.return_value
+
+    def _loop_checkpointed(self):
+        """Execute like _loop, writing a snapshot every checkpoint_every instructions"""
+        countdown = self.checkpoint_every
 
         while self.pc < len(self.instructions):
             pc_delta = self.execute(self.instructions[self.pc])
             self.pc += 1 + pc_delta
 
+            countdown -= 1
+            if not countdown:
+                self.snapshot(self.checkpoint_path)
+                countdown = self.checkpoint_every
+
+        return self.return_value
+
+    def _loop_decoded(self):
+        """Execute decoded instructions, each of which returns the next pc.
+
+        Checkpoints count instructions through ``fuel`` like run_for, so the
+        iterations of compiled loops count too.
+        """
+        ops = self._ops
+        size = len(ops)
+        pc = self.pc
+
+        try:
+            if self.checkpoint_every:
+                self.fuel = self.checkpoint_every
+                while pc < size:
+                    pc = ops[pc]()
+                    self.fuel -= 1
+                    if self.fuel <= 0:
+                        self.pc = pc
+                        self.snapshot(self.checkpoint_path)
+                        self.fuel = self.checkpoint_every
+            else:
+                self.fuel = UNLIMITED
+                while pc < size:
+                    pc = ops[pc]()
+        finally:
+            self.pc = pc
+
         return self.return_value